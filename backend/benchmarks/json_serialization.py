@@ -0,0 +1,70 @@
+"""
+Benchmark of JSON serialization paths for listing pages.
+Compares the original dict(row) + jsonify path with the fast encoder on
+pages of 100 and 1000 listing rows read from an in-memory SQLite database.
+
+Run from the backend directory:
+    python benchmarks/json_serialization.py
+"""
+
+import os
+import sqlite3
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from src.utils.fast_json import RowJSONEncoder, dumps, json_response, orjson
+
+PAGE_SIZES = [100, 1000]
+REPEAT = 5
+
+# Create an in-memory listings table with realistic text lengths
+def create_rows(count):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE listings (
+            id INTEGER PRIMARY KEY, title TEXT, description TEXT, category TEXT,
+            purchase_method TEXT, payment_terms TEXT, listing_type TEXT,
+            delivery_date DATE, purchase_date DATE, publication_period INTEGER,
+            status TEXT, user_id INTEGER, company_id INTEGER, city TEXT, country TEXT,
+            created_at TIMESTAMP, updated_at TIMESTAMP
+        )
+    ''')
+    conn.executemany('''
+        INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(
+        i, f'Поставка металлопроката №{i}', 'Арматура А500С, ГОСТ 34028-2016. ' * 20, 'metal',
+        'tender', 'postpay', 'purchase', '2026-11-01', '2026-10-25', 7,
+        'published', i % 50, i % 10, 'Астана', 'KZ', '2026-10-01 12:00:00', '2026-10-01 12:00:00'
+    ) for i in range(count)])
+    return conn.execute('SELECT * FROM listings').fetchall()
+
+def page(listings):
+    return {'listings': listings, 'total': len(listings), 'page': 1, 'per_page': len(listings), 'total_pages': 1}
+
+def main():
+    app = Flask(__name__)
+    app.json_encoder = RowJSONEncoder
+
+    print(f"fast encoder backend: {'orjson' if orjson is not None else 'json (stdlib)'}")
+    print(f"{'rows':>6}  {'path':<28} {'ms/page':>9} {'bytes':>9}")
+
+    with app.test_request_context():
+        for size in PAGE_SIZES:
+            rows = create_rows(size)
+            cases = [
+                ('dict(row) + jsonify', lambda: jsonify(page([dict(row) for row in rows])).get_data()),
+                ('rows + jsonify (encoder)', lambda: jsonify(page(rows)).get_data()),
+                ('rows + json_response', lambda: json_response(page(rows)).get_data()),
+                ('rows + dumps only', lambda: dumps(page(rows)))
+            ]
+            for name, case in cases:
+                number = max(1, 2000 // size)
+                best = min(timeit.repeat(case, number=number, repeat=REPEAT)) / number
+                print(f'{size:>6}  {name:<28} {best * 1000:>9.3f} {len(case()):>9}')
+
+if __name__ == '__main__':
+    main()
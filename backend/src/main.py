@@ -6,6 +6,7 @@ import os
 import sys
 from flask import Flask, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Add the project root directory to the Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -17,16 +18,34 @@ from src.routes.companies import companies_bp
 from src.routes.listings import listings_bp
 from src.routes.responses import responses_bp
 from src.routes.admin import admin_bp
+from src.routes.events import events_bp
+from src.routes.batch import batch_bp
+from src.utils.deletion_worker import deletion_worker
+from src.utils.compression import compress_response
+from src.utils.fast_json import RowJSONEncoder
+from src.repositories.engine import DATABASE_URL, check_database_url
 
 # Create Flask app
 app = Flask(__name__)
 CORS(app)
 
-# Configure SQLite database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'metal_rezerv.db')}"
+# jsonify accepts sqlite3.Row values directly
+app.json_encoder = RowJSONEncoder
+
+# Configure the database (the SQLite file of all routes, see DATABASE_URL)
+check_database_url(DATABASE_URL)
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
 
+# Number of reverse proxies in front of the app whose X-Forwarded-* headers are
+# trusted. Client IPs (rate limits) come from X-Forwarded-For only when set;
+# leave it at 0 when the app is exposed directly, or clients can spoof their IP.
+app.config['TRUSTED_PROXY_COUNT'] = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+if app.config['TRUSTED_PROXY_COUNT']:
+    proxies = app.config['TRUSTED_PROXY_COUNT']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(users_bp, url_prefix='/api/users')
@@ -34,6 +53,14 @@ app.register_blueprint(companies_bp, url_prefix='/api/companies')
 app.register_blueprint(listings_bp, url_prefix='/api/listings')
 app.register_blueprint(responses_bp, url_prefix='/api')  # Changed to /api to support both /api/listings/<id>/responses and /api/responses/...
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
+app.register_blueprint(events_bp, url_prefix='/api/events')
+app.register_blueprint(batch_bp, url_prefix='/api/batch')
+
+# Compress JSON responses for clients that accept it
+app.after_request(compress_response)
+
+# Resume deletion jobs queued before a restart, once the database is initialized
+app.before_first_request(deletion_worker.start)
 
 # Error handlers
 @app.errorhandler(404)
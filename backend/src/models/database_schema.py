@@ -7,12 +7,72 @@ from datetime import datetime
 import sqlite3
 import os
 
+# Tables whose changes are counted in table_versions (used for HTTP cache validators)
+VERSIONED_TABLES = ['users', 'listings', 'responses', 'reviews', 'subscriptions']
+
+# Tables whose updated_at column is maintained by triggers
+TIMESTAMPED_TABLES = ['users', 'companies', 'listings', 'responses']
+
+# Columns derived from other columns of the same row: table -> {column: SQL
+# expression over NEW}. They are set by an insert trigger and recomputed by
+# the {table}_after_update trigger.
+DERIVED_COLUMNS = {
+    'listings': {'description_preview': 'substr(NEW.description, 1, 160)'}
+}
+
+# Tables recorded in change_log (used for delta-sync feeds), with the
+# owner, listing and listing owner stored alongside each change. {row} is
+# NEW or OLD. The listing owner is kept in the log, so changes stay visible
+# to the owner after the listing is deleted or archived.
+LOGGED_TABLES = {
+    'listings': {'user_id': '{row}.user_id', 'listing_id': '{row}.id', 'listing_owner_id': '{row}.user_id'},
+    'responses': {
+        'user_id': '{row}.user_id',
+        'listing_id': '{row}.listing_id',
+        'listing_owner_id': '(SELECT user_id FROM listings WHERE id = {row}.listing_id)'
+    }
+}
+
+# Helper function to build the change_log insert of a trigger
+def change_log_insert(table, row, operation):
+    columns = LOGGED_TABLES[table]
+    values = ', '.join(expression.format(row=row) for expression in columns.values())
+    return f'''
+            INSERT INTO change_log (table_name, row_id, operation, {', '.join(columns)})
+            VALUES ('{table}', {row}.id, '{operation}', {values});'''
+
+# Executor reputation score kept in executor_stats.
+# Bayesian average rating (prior of 3 reviews at 3.5 stars) scaled to 100,
+# plus completed jobs, experience level and points, each capped.
+EXECUTOR_SCORE_SQL = '''
+    UPDATE executor_stats
+    SET score = (rating_sum + 3.5 * 3) / (review_count + 3.0) * 20
+        + MIN(completed_jobs, 50)
+        + COALESCE((
+            SELECT CASE experience_level WHEN 'EXPERT' THEN 10 WHEN 'EXPERIENCED' THEN 5 ELSE 0 END
+            + MIN(COALESCE(points, 0), 1000) / 100.0
+            FROM executor_profiles WHERE user_id = executor_stats.user_id
+        ), 0),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = {user_id}
+'''
+
+# PRAGMA user_version after the one-time cleanup of rows orphaned while
+# foreign keys were not enforced
+ORPHAN_CLEANUP_VERSION = 1
+
+# Derived per-user tables without foreign keys, cleaned up with the orphans
+DERIVED_USER_TABLES = ['executor_stats', 'executor_category_affinity']
+
 # Database initialization
 def init_db(db_path):
     """Initialize the database with all required tables"""
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
+    # WAL lets read connections run alongside the writer (persistent setting)
+    cursor.execute('PRAGMA journal_mode = WAL')
+    
     # Create Users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -76,6 +136,7 @@ def init_db(db_path):
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT NOT NULL,
         description TEXT,
+        description_preview TEXT,  -- start of the description, maintained by triggers
         category TEXT,
         purchase_method TEXT,
         payment_terms TEXT,
@@ -86,6 +147,8 @@ def init_db(db_path):
         status TEXT DEFAULT 'published',  -- 'published', 'unpublished', 'completed'
         user_id INTEGER NOT NULL,
         company_id INTEGER,
+        city TEXT COLLATE NOCASE,  -- defaults to the owner's city
+        country TEXT COLLATE NOCASE,  -- defaults to the owner's country
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
@@ -93,6 +156,27 @@ def init_db(db_path):
     )
     ''')
     
+    # Listing location, added after the first release: backfill from the owners
+    location_added = add_column_if_missing(cursor, 'listings', 'city', 'TEXT COLLATE NOCASE')
+    location_added = add_column_if_missing(cursor, 'listings', 'country', 'TEXT COLLATE NOCASE') or location_added
+    if location_added:
+        cursor.execute('''
+        UPDATE listings
+        SET city = (SELECT city FROM users WHERE users.id = listings.user_id),
+            country = (SELECT country FROM users WHERE users.id = listings.user_id)
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_status_region_created ON listings (status, country, city, created_at)')
+    
+    # Description preview, added after the first release: backfill it with the
+    # update trigger dropped, so the backfill does not touch updated_at.
+    # The trigger is recreated below.
+    if add_column_if_missing(cursor, 'listings', 'description_preview', 'TEXT'):
+        cursor.execute('DROP TRIGGER IF EXISTS listings_after_update')
+        cursor.execute(f'''
+        UPDATE listings SET description_preview = {DERIVED_COLUMNS['listings']['description_preview'].replace('NEW.', '')}
+        WHERE description IS NOT NULL
+        ''')
+    
     # Create Responses table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS responses (
@@ -155,9 +239,477 @@ def init_db(db_path):
     )
     ''')
     
+    # Archive tables: completed listings with their responses and reviews are
+    # moved here by the archive job, so the hot tables only hold active data.
+    # Ids are kept, and there are no foreign keys to the hot tables.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS listings_archive (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        description_preview TEXT,
+        category TEXT,
+        purchase_method TEXT,
+        payment_terms TEXT,
+        listing_type TEXT,
+        delivery_date DATE,
+        purchase_date DATE,
+        publication_period INTEGER,
+        status TEXT,
+        user_id INTEGER NOT NULL,
+        company_id INTEGER,
+        city TEXT COLLATE NOCASE,
+        country TEXT COLLATE NOCASE,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_archive_user_created ON listings_archive (user_id, created_at)')
+    if add_column_if_missing(cursor, 'listings_archive', 'description_preview', 'TEXT'):
+        cursor.execute(f'''
+        UPDATE listings_archive SET description_preview = {DERIVED_COLUMNS['listings']['description_preview'].replace('NEW.', '')}
+        WHERE description IS NOT NULL
+        ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS responses_archive (
+        id INTEGER PRIMARY KEY,
+        listing_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        company_id INTEGER,
+        status TEXT,
+        message TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_responses_archive_user_created ON responses_archive (user_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_responses_archive_listing ON responses_archive (listing_id)')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reviews_archive (
+        id INTEGER PRIMARY KEY,
+        listing_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        executor_id INTEGER NOT NULL,
+        rating INTEGER NOT NULL,
+        text TEXT,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_executor_created ON reviews_archive (executor_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_customer ON reviews_archive (customer_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_archive_listing ON reviews_archive (listing_id)')
+    
+    # Create Subscriptions table (executor interest in a category and region)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        city TEXT NOT NULL DEFAULT '',  -- '' matches every city
+        country TEXT NOT NULL DEFAULT '',  -- '' matches every country
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+        UNIQUE(user_id, category, city, country)
+    )
+    ''')
+    
+    # Create Notifications table (per-user inbox)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        listing_id INTEGER,
+        type TEXT NOT NULL,  -- 'new_listing'
+        message TEXT,
+        is_read INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+        FOREIGN KEY (listing_id) REFERENCES listings (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user_read ON notifications (user_id, is_read, id)')
+    
+    # Create Executor_Category_Affinity table (how often an executor responded per category)
+    affinity_exists = table_exists(cursor, 'executor_category_affinity')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS executor_category_affinity (
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        responses_count INTEGER NOT NULL DEFAULT 0,
+        last_response_at TIMESTAMP,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID
+    ''')
+    if not affinity_exists:
+        cursor.execute('''
+        INSERT INTO executor_category_affinity (user_id, category, responses_count, last_response_at)
+        SELECT r.user_id, l.category, COUNT(*), MAX(r.created_at)
+        FROM responses r
+        JOIN listings l ON r.listing_id = l.id
+        WHERE l.category IS NOT NULL
+        GROUP BY r.user_id, l.category
+        ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS responses_affinity_insert
+    AFTER INSERT ON responses
+    BEGIN
+        INSERT OR IGNORE INTO executor_category_affinity (user_id, category)
+        SELECT NEW.user_id, category FROM listings WHERE id = NEW.listing_id AND category IS NOT NULL;
+        UPDATE executor_category_affinity
+        SET responses_count = responses_count + 1, last_response_at = CURRENT_TIMESTAMP
+        WHERE user_id = NEW.user_id
+        AND category = (SELECT category FROM listings WHERE id = NEW.listing_id);
+    END
+    ''')
+    
+    # Create Listing_Stats table (number of responses per listing)
+    stats_exists = table_exists(cursor, 'listing_stats')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS listing_stats (
+        listing_id INTEGER PRIMARY KEY,
+        responses_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    if not stats_exists:
+        cursor.execute('''
+        INSERT INTO listing_stats (listing_id, responses_count)
+        SELECT listing_id, COUNT(*) FROM responses GROUP BY listing_id
+        ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS responses_stats_insert
+    AFTER INSERT ON responses
+    BEGIN
+        INSERT OR IGNORE INTO listing_stats (listing_id) VALUES (NEW.listing_id);
+        UPDATE listing_stats SET responses_count = responses_count + 1 WHERE listing_id = NEW.listing_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS responses_stats_delete
+    AFTER DELETE ON responses
+    BEGIN
+        UPDATE listing_stats SET responses_count = responses_count - 1 WHERE listing_id = OLD.listing_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS listings_stats_delete
+    AFTER DELETE ON listings
+    BEGIN
+        DELETE FROM listing_stats WHERE listing_id = OLD.id;
+    END
+    ''')
+    
+    # Indexes for listing browsing and the executor feed.
+    # The status/created_at index also covers the summary view of listing
+    # pages, so those are read from the index alone.
+    cursor.execute('DROP INDEX IF EXISTS idx_listings_status_created')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_listings_status_created_summary ON listings (
+        status, created_at, category, title, description_preview,
+        delivery_date, purchase_date, city, country, user_id
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_status_category_created ON listings (status, category, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_responses_listing_user ON responses (listing_id, user_id)')
+    
+    # Indexes for delivery/purchase date windows and the listing calendar
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_status_delivery ON listings (status, delivery_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_status_purchase ON listings (status, purchase_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_user_delivery ON listings (user_id, delivery_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_listings_user_purchase ON listings (user_id, purchase_date)')
+    
+    # Create Executor_Stats table (precomputed executor reputation)
+    executor_stats_exists = table_exists(cursor, 'executor_stats')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS executor_stats (
+        user_id INTEGER PRIMARY KEY,
+        review_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        completed_jobs INTEGER NOT NULL DEFAULT 0,
+        score REAL NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_executor_stats_score ON executor_stats (score)')
+    if not executor_stats_exists:
+        cursor.execute('''
+        INSERT INTO executor_stats (user_id, review_count, rating_sum, completed_jobs)
+        SELECT ep.user_id, COUNT(rv.rating), COALESCE(SUM(rv.rating), 0), COUNT(rv.rating)
+        FROM executor_profiles ep
+        LEFT JOIN (
+            SELECT executor_id, rating FROM reviews
+            UNION ALL
+            SELECT executor_id, rating FROM reviews_archive
+        ) rv ON rv.executor_id = ep.user_id
+        GROUP BY ep.user_id
+        ''')
+        cursor.execute(EXECUTOR_SCORE_SQL.format(user_id='executor_stats.user_id'))
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS executor_profiles_stats_insert
+    AFTER INSERT ON executor_profiles
+    BEGIN
+        INSERT OR IGNORE INTO executor_stats (user_id) VALUES (NEW.user_id);
+        {EXECUTOR_SCORE_SQL.format(user_id='NEW.user_id')};
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS executor_profiles_stats_update
+    AFTER UPDATE OF experience_level, points ON executor_profiles
+    BEGIN
+        {EXECUTOR_SCORE_SQL.format(user_id='NEW.user_id')};
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_stats_insert
+    AFTER INSERT ON reviews
+    BEGIN
+        INSERT OR IGNORE INTO executor_stats (user_id) VALUES (NEW.executor_id);
+        UPDATE executor_stats
+        SET review_count = review_count + 1,
+            rating_sum = rating_sum + NEW.rating,
+            completed_jobs = completed_jobs + 1
+        WHERE user_id = NEW.executor_id;
+        {EXECUTOR_SCORE_SQL.format(user_id='NEW.executor_id')};
+    END
+    ''')
+    # Reviews moved to the archive still count; the trigger is recreated so
+    # databases from before the archive get the WHEN clause
+    cursor.execute('DROP TRIGGER IF EXISTS reviews_stats_delete')
+    cursor.execute(f'''
+    CREATE TRIGGER reviews_stats_delete
+    AFTER DELETE ON reviews
+    WHEN NOT EXISTS (SELECT 1 FROM reviews_archive WHERE id = OLD.id)
+    BEGIN
+        UPDATE executor_stats
+        SET review_count = review_count - 1,
+            rating_sum = rating_sum - OLD.rating,
+            completed_jobs = completed_jobs - 1
+        WHERE user_id = OLD.executor_id;
+        {EXECUTOR_SCORE_SQL.format(user_id='OLD.executor_id')};
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_archive_stats_delete
+    AFTER DELETE ON reviews_archive
+    BEGIN
+        UPDATE executor_stats
+        SET review_count = review_count - 1,
+            rating_sum = rating_sum - OLD.rating,
+            completed_jobs = completed_jobs - 1
+        WHERE user_id = OLD.executor_id;
+        {EXECUTOR_SCORE_SQL.format(user_id='OLD.executor_id')};
+    END
+    ''')
+    
+    # Indexes for executor suggestions
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_affinity_category ON executor_category_affinity (category, user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_category ON subscriptions (category, user_id)')
+    
+    # Create Table_Versions table (change counter per table)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Bump the version of a table on every insert, update and delete
+    for table in VERSIONED_TABLES:
+        cursor.execute('INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)', (table,))
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{operation.lower()}
+            AFTER {operation} ON {table}
+            BEGIN
+                UPDATE table_versions
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+            ''')
+    
+    # Create Deletion_Jobs table (queue of the background deletion worker)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS deletion_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,  -- 'user'
+        entity_id INTEGER NOT NULL,
+        status TEXT DEFAULT 'pending',  -- 'pending', 'running', 'done', 'failed'
+        deleted_rows INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deletion_jobs_status ON deletion_jobs (status, id)')
+    
+    # Create Idempotency_Keys table (stored results of retried POST requests)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,  -- Idempotency-Key header of the request
+        request_hash TEXT NOT NULL,  -- method, path and body of the first request
+        status TEXT DEFAULT 'in_progress',  -- 'in_progress', 'completed'
+        response_status INTEGER,
+        response_body TEXT,
+        response_mimetype TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, key),
+        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)')
+    
+    # Create Change_Log table (monotonic change sequence for delta sync)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        operation TEXT NOT NULL,  -- 'insert', 'update', 'delete'
+        user_id INTEGER,  -- owner of the changed row
+        listing_id INTEGER,  -- listing the changed row belongs to
+        listing_owner_id INTEGER,  -- owner of that listing
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq)')
+    
+    # Listing owners of changes logged before the column existed, as far as
+    # their listings are still there
+    if add_column_if_missing(cursor, 'change_log', 'listing_owner_id', 'INTEGER'):
+        cursor.execute('''
+            UPDATE change_log SET listing_owner_id = COALESCE(
+                (SELECT user_id FROM listings WHERE id = change_log.listing_id),
+                (SELECT user_id FROM listings_archive WHERE id = change_log.listing_id)
+            )
+        ''')
+    
+    # Keep updated_at and derived columns current on every update.
+    # Relies on recursive_triggers being off (the SQLite default), so the
+    # inner UPDATE does not fire the same trigger again. Updates that only
+    # set derived columns come from the insert triggers below and are skipped.
+    # The triggers are recreated on every start to pick up definition changes.
+    for table in TIMESTAMPED_TABLES:
+        derived = DERIVED_COLUMNS.get(table, {})
+        assignments = ''.join(f', {column} = {expression}' for column, expression in derived.items())
+        when_clause = ''
+        if derived:
+            when_clause = 'WHEN ' + ' AND '.join(f'NEW.{column} IS OLD.{column}' for column in derived)
+        
+        log_statement = ''
+        if table in LOGGED_TABLES:
+            log_statement = change_log_insert(table, 'NEW', 'update')
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_after_update')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_after_update
+        AFTER UPDATE ON {table}
+        {when_clause}
+        BEGIN
+            UPDATE {table} SET updated_at = CURRENT_TIMESTAMP{assignments} WHERE id = NEW.id;{log_statement}
+        END
+        ''')
+    
+    # Compute derived columns of new rows
+    for table, derived in DERIVED_COLUMNS.items():
+        assignments = ', '.join(f'{column} = {expression}' for column, expression in derived.items())
+        stale = ' OR '.join(f'NEW.{column} IS NOT {expression}' for column, expression in derived.items())
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_derived_insert
+        AFTER INSERT ON {table}
+        WHEN {stale}
+        BEGIN
+            UPDATE {table} SET {assignments} WHERE id = NEW.id;
+        END
+        ''')
+    
+    # Record inserts and deletes of logged tables (recreated like the update triggers)
+    for table in LOGGED_TABLES:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_log_insert')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_log_insert
+        AFTER INSERT ON {table}
+        BEGIN{change_log_insert(table, 'NEW', 'insert')}
+        END
+        ''')
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_log_delete')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_log_delete
+        AFTER DELETE ON {table}
+        BEGIN{change_log_insert(table, 'OLD', 'delete')}
+        END
+        ''')
+    
+    # Delete the responses of a listing before the listing itself. Rows
+    # removed by ON DELETE CASCADE no longer see their listing, so their
+    # change_log entries would lose the listing owner.
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS listings_delete_responses
+    BEFORE DELETE ON listings
+    BEGIN
+        DELETE FROM responses WHERE listing_id = OLD.id;
+    END
+    ''')
+    
+    # Remove rows orphaned while foreign keys were not enforced (runs once)
+    if cursor.execute('PRAGMA user_version').fetchone()[0] < ORPHAN_CLEANUP_VERSION:
+        cleanup_orphans(cursor)
+        cursor.execute(f'PRAGMA user_version = {ORPHAN_CLEANUP_VERSION}')
+    
     conn.commit()
     conn.close()
 
+# Helper function to check if a table already exists
+def table_exists(cursor, table):
+    row = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+# Helper function to add a column to an existing table, returns True if it was added
+def add_column_if_missing(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column in columns:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+# Helper function to apply the ON DELETE actions of every foreign key to rows
+# whose parent is already gone. Repeats until nothing changes, since removing
+# orphans can orphan their own children.
+def cleanup_orphans(cursor):
+    tables = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()]
+    
+    foreign_keys = []
+    for table in tables:
+        for fk in cursor.execute(f'PRAGMA foreign_key_list({table})').fetchall():
+            # (id, seq, parent table, column, parent column, on_update, on_delete, match)
+            foreign_keys.append((table, fk[2], fk[3], fk[4] or 'id', fk[6]))
+    
+    changed = True
+    while changed:
+        changed = False
+        for table, parent, column, parent_column, on_delete in foreign_keys:
+            orphaned = f'{column} IS NOT NULL AND {column} NOT IN (SELECT {parent_column} FROM {parent})'
+            if on_delete == 'CASCADE':
+                cursor.execute(f'DELETE FROM {table} WHERE {orphaned}')
+            elif on_delete == 'SET NULL':
+                cursor.execute(f'UPDATE {table} SET {column} = NULL WHERE {orphaned}')
+            else:
+                continue
+            if cursor.rowcount > 0:
+                changed = True
+    
+    for table in DERIVED_USER_TABLES:
+        cursor.execute(f'DELETE FROM {table} WHERE user_id NOT IN (SELECT id FROM users)')
+
 # Helper function to create database directory if it doesn't exist
 def ensure_db_directory(db_path):
     db_dir = os.path.dirname(db_path)
@@ -0,0 +1,52 @@
+"""
+Company repository of the Metal-Rezerv API.
+Reads companies and their members through SQLAlchemy Core.
+"""
+
+from sqlalchemy import and_, bindparam, select
+from src.repositories.engine import Repository
+from src.repositories.tables import companies, company_users, users
+
+SELECT_COMPANY = select(companies).where(companies.c.id == bindparam('company_id'))
+
+SELECT_USER_COMPANY = (
+    select(companies)
+    .join(company_users, companies.c.id == company_users.c.company_id)
+    .where(company_users.c.user_id == bindparam('user_id'))
+)
+
+SELECT_MEMBERSHIP = select(company_users).where(and_(
+    company_users.c.company_id == bindparam('company_id'),
+    company_users.c.user_id == bindparam('user_id')
+))
+
+SELECT_EMPLOYEES = (
+    select(
+        users.c.id, users.c.email, users.c.role.label('user_role'), users.c.phone,
+        users.c.city, users.c.country, company_users.c.role.label('company_role')
+    )
+    .join(company_users, users.c.id == company_users.c.user_id)
+    .where(company_users.c.company_id == bindparam('company_id'))
+)
+
+class CompanyRepository(Repository):
+    """Queries of companies and company members."""
+
+    # Get a company, or None
+    def get(self, company_id):
+        return self._fetch_one(SELECT_COMPANY, company_id=company_id)
+
+    # Get the company a user belongs to, or None
+    def get_for_user(self, user_id):
+        return self._fetch_one(SELECT_USER_COMPANY, user_id=user_id)
+
+    # Get the membership of a user in a company, or None
+    def get_membership(self, company_id, user_id):
+        return self._fetch_one(SELECT_MEMBERSHIP, company_id=company_id, user_id=user_id)
+
+    # Get the members of a company with their company role
+    def list_employees(self, company_id):
+        return self._fetch_all(SELECT_EMPLOYEES, company_id=company_id)
+
+# Repository shared by all requests
+company_repository = CompanyRepository()
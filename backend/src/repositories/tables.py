@@ -0,0 +1,55 @@
+"""
+Table definitions of the repository layer.
+Mirrors the columns of models/database_schema.py that repositories read;
+the schema itself is still created by init_db.
+"""
+
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table, Text
+from src.repositories.engine import Timestamp
+
+metadata = MetaData()
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('email', Text, nullable=False, unique=True),
+    Column('password', Text, nullable=False),
+    Column('role', Text, nullable=False),
+    Column('phone', Text),
+    Column('city', Text),
+    Column('country', Text),
+    Column('balance', Integer, default=0),
+    Column('created_at', Timestamp),
+    Column('updated_at', Timestamp)
+)
+
+companies = Table(
+    'companies', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', Text, nullable=False),
+    Column('bin', Text),
+    Column('address', Text),
+    Column('status', Text, default='pending'),
+    Column('balance', Integer, default=0),
+    Column('max_balance', Integer, default=1000),
+    Column('created_at', Timestamp),
+    Column('updated_at', Timestamp)
+)
+
+company_users = Table(
+    'company_users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('company_id', Integer, ForeignKey('companies.id', ondelete='CASCADE'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('role', Text, nullable=False),
+    Column('added_at', Timestamp)
+)
+
+executor_profiles = Table(
+    'executor_profiles', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, unique=True),
+    Column('experience_level', Text, default='BEGINNER'),
+    Column('points', Integer, default=0),
+    Column('spent_points', Integer, default=0)
+)
@@ -0,0 +1,32 @@
+"""
+User repository of the Metal-Rezerv API.
+Reads users and executor profiles through SQLAlchemy Core.
+"""
+
+from sqlalchemy import bindparam, select
+from src.repositories.engine import Repository
+from src.repositories.tables import users, executor_profiles
+
+# User columns safe to return to clients (no password)
+USER_PUBLIC_COLUMNS = [
+    users.c.id, users.c.email, users.c.role, users.c.phone, users.c.city,
+    users.c.country, users.c.created_at, users.c.balance
+]
+
+SELECT_USER = select(*USER_PUBLIC_COLUMNS).where(users.c.id == bindparam('user_id'))
+
+SELECT_EXECUTOR_PROFILE = select(executor_profiles).where(executor_profiles.c.user_id == bindparam('user_id'))
+
+class UserRepository(Repository):
+    """Queries of users and their executor profiles."""
+
+    # Get a user without the password, or None
+    def get(self, user_id):
+        return self._fetch_one(SELECT_USER, user_id=user_id)
+
+    # Get the executor profile of a user, or None
+    def get_executor_profile(self, user_id):
+        return self._fetch_one(SELECT_EXECUTOR_PROFILE, user_id=user_id)
+
+# Repository shared by all requests
+user_repository = UserRepository()
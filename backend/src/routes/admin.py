@@ -3,11 +3,14 @@ Admin routes for the Metal-Rezerv API.
 Handles administrative functions like approving companies, managing users, and system settings.
 """
 
-import sqlite3
 import os
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash
 from src.utils.auth_middleware import admin_required
+from src.utils.exports import build_export_query, get_export_format, wants_gzip, stream_export
+from src.utils.db import connect, lane_metrics
+from src.utils.archive import ARCHIVE_AFTER_DAYS, archive_completed_listings
+from src.utils.write_queue import write_queue
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -16,9 +19,7 @@ DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)
 
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
 
 # Get all companies
 @admin_bp.route('/companies', methods=['GET'])
@@ -365,6 +366,85 @@ def get_activity_log(current_user):
     finally:
         conn.close()
 
+# Move old completed listings with their responses and reviews to the archive
+@admin_bp.route('/archive/run', methods=['POST'])
+@admin_required
+def run_archive(current_user):
+    data = request.get_json(silent=True) or {}
+    
+    older_than_days = data.get('older_than_days', ARCHIVE_AFTER_DAYS)
+    if not isinstance(older_than_days, int) or older_than_days < 0:
+        return jsonify({'error': 'Invalid older_than_days value'}), 400
+    
+    conn = get_db_connection()
+    try:
+        archived = archive_completed_listings(conn, older_than_days)
+        
+        return jsonify({
+            'message': 'Archive finished',
+            'older_than_days': older_than_days,
+            'archived': archived
+        }), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get background deletion jobs
+@admin_bp.route('/deletion-jobs', methods=['GET'])
+@admin_required
+def get_deletion_jobs(current_user):
+    status = request.args.get('status')
+    
+    conn = get_db_connection()
+    try:
+        query = 'SELECT * FROM deletion_jobs'
+        params = []
+        
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        
+        query += ' ORDER BY id DESC LIMIT 100'
+        
+        jobs = conn.execute(query, params).fetchall()
+        
+        return jsonify({'jobs': [dict(job) for job in jobs]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get connection metrics of the read and write lanes and the write queue
+@admin_bp.route('/db-metrics', methods=['GET'])
+@admin_required
+def get_db_metrics(current_user):
+    return jsonify({
+        'lanes': lane_metrics.snapshot(),
+        'write_queue': write_queue.metrics()
+    }), 200
+
+# Export listings, responses, transactions or the activity log
+@admin_bp.route('/export/<entity>', methods=['GET'])
+@admin_required
+def export_data(current_user, entity):
+    try:
+        query, params = build_export_query(entity, request.args, request.args.get('company_id'))
+        fmt = get_export_format(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    try:
+        # The streamed response closes the connection when it is done
+        return stream_export(conn, query, params, fmt, entity, wants_gzip(request.args))
+    except Exception as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
 # Update company max balance
 @admin_bp.route('/companies/<int:company_id>/max-balance', methods=['PUT'])
 @admin_required
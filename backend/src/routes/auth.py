@@ -3,12 +3,13 @@ Authentication routes for the Metal-Rezerv API.
 Handles user registration (two-step process), login, and token validation.
 """
 
-import sqlite3
 import jwt
 import datetime
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+from src.utils.db import connect
+from src.utils.rate_limit import rate_limit
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -17,9 +18,7 @@ DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)
 
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
 
 # Generate JWT token
 def generate_token(user_id, role):
@@ -37,6 +36,7 @@ def generate_token(user_id, role):
 
 # Step 1: Register user
 @auth_bp.route('/register/step1', methods=['POST'])
+@rate_limit('register', 20, 600, key='ip')
 def register_step1():
     data = request.get_json()
     
@@ -139,6 +139,8 @@ def register_step2():
 
 # Login
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login', 30, 60, key='ip')
+@rate_limit('login', 5, 60, key='email')
 def login():
     data = request.get_json()
     
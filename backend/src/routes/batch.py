@@ -0,0 +1,116 @@
+"""
+Batch routes for the Metal-Rezerv API.
+Runs several GET requests of the API in one HTTP call. Sub-requests are
+dispatched in-process against the registered blueprints with the caller's
+Authorization header, so the token is verified once and, when run in
+sequence, all sub-requests share one database connection.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, current_app, g
+from src.utils.auth_middleware import token_required
+from src.utils.db import open_shared_connection
+from src.utils.fast_json import json_response
+
+batch_bp = Blueprint('batch', __name__)
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
+
+# Limits of a single batch
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Paths that can not run inside a batch (nested batches, event streams)
+BATCH_EXCLUDED_PREFIXES = ('/api/batch', '/api/events')
+
+# Helper function to validate the sub-requests of a batch.
+# Accepts paths or {"id", "path"} objects; returns a list of (id, path).
+# Raises ValueError with a client-facing message if the batch is invalid.
+def parse_batch_requests(items):
+    if not isinstance(items, list) or not items:
+        raise ValueError('requests must be a non-empty list')
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise ValueError(f'A batch can contain at most {BATCH_MAX_REQUESTS} requests')
+
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'path': item}
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValueError(f'Request {index} must be a path or an object with a path')
+
+        path = item['path']
+        if not path.startswith('/api/') or path.split('?', 1)[0].startswith(BATCH_EXCLUDED_PREFIXES):
+            raise ValueError(f'Request {index} has an unsupported path: {path}')
+
+        parsed.append((item.get('id', index), path))
+    return parsed
+
+# Dispatch one GET sub-request in the current app context
+def dispatch_sub_request(app, request_id, path, authorization):
+    headers = {'Authorization': authorization} if authorization else {}
+    with app.test_request_context(path, method='GET', headers=headers):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            app.logger.exception('Batch sub-request %s failed', path)
+            return {'id': request_id, 'path': path, 'status': 500, 'body': {'error': 'Server error'}}
+
+    if response.is_streamed:
+        response.close()
+        return {'id': request_id, 'path': path, 'status': 400,
+                'body': {'error': 'Streamed responses are not supported in a batch'}}
+
+    body = response.get_json() if response.is_json else response.get_data(as_text=True)
+    return {'id': request_id, 'path': path, 'status': response.status_code, 'body': body}
+
+# Dispatch one sub-request on a worker thread with its own app context.
+# Verified tokens are copied over, so the token is not decoded again.
+def dispatch_in_thread(app, token_payloads, request_id, path, authorization):
+    with app.app_context():
+        g.token_payloads = dict(token_payloads)
+        return dispatch_sub_request(app, request_id, path, authorization)
+
+# Execute a batch of GET requests
+@batch_bp.route('', methods=['POST'])
+@token_required
+def execute_batch(current_user):
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        sub_requests = parse_batch_requests(data.get('requests'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    app = current_app._get_current_object()
+    authorization = request.headers.get('Authorization')
+    
+    # Independent sub-requests may run in parallel, each with its own connection
+    if data.get('parallel'):
+        token_payloads = g.get('token_payloads', {})
+        workers = min(BATCH_MAX_WORKERS, len(sub_requests))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(dispatch_in_thread, app, token_payloads, request_id, path, authorization)
+                for request_id, path in sub_requests
+            ]
+            results = [future.result() for future in futures]
+        return json_response({'responses': results})
+    
+    # Otherwise run them in order on one shared connection
+    conn = open_shared_connection(DB_PATH)
+    try:
+        results = []
+        for request_id, path in sub_requests:
+            results.append(dispatch_sub_request(app, request_id, path, authorization))
+            
+            # Do not carry a transaction left open by a failed handler into the next one
+            if conn.in_transaction:
+                conn.rollback()
+        
+        return json_response({'responses': results})
+    finally:
+        g.pop('shared_connection', None)
+        conn.release()
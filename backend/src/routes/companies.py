@@ -3,66 +3,114 @@ Company management routes for the Metal-Rezerv API.
 Handles company operations, employee management, and balance operations.
 """
 
-import sqlite3
 import os
+import io
+import csv
 import random
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash
 from src.utils.auth_middleware import token_required
+from src.utils.exports import build_export_query, get_export_format, wants_gzip, stream_export
+from src.utils.db import connect
+from src.utils.write_queue import write_queue, WriteUnavailable, write_unavailable_response
+from src.repositories.companies import company_repository
+from src.utils.idempotency import idempotent
 
 companies_bp = Blueprint('companies', __name__)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
 
+# Employee roles that can be assigned on onboarding
+VALID_EMPLOYEE_USER_ROLES = ['customer', 'executor']
+VALID_EMPLOYEE_COMPANY_ROLES = ['admin', 'manager', 'employee']
+EMPLOYEE_REQUIRED_FIELDS = ['email', 'password', 'role', 'company_role']
+
+# Bulk onboarding settings
+BULK_ONBOARDING_MAX_ROWS = 1000
+PASSWORD_HASH_WORKERS = 4
+BALANCE_DISTRIBUTION_MAX_USERS = 1000
+# SQLite limits the number of bound variables per statement
+SQL_IN_CHUNK_SIZE = 500
+
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
+
+# Helper function to validate one employee record, returns an error message or None
+def validate_employee_data(data):
+    for field in EMPLOYEE_REQUIRED_FIELDS:
+        if field not in data:
+            return f'Missing required field: {field}'
+    
+    if data['role'] not in VALID_EMPLOYEE_USER_ROLES:
+        return 'Invalid user role'
+    
+    if data['company_role'] not in VALID_EMPLOYEE_COMPANY_ROLES:
+        return 'Invalid company role'
+    
+    return None
+
+# Helper function to check if the current user may manage company employees
+def get_employee_manager(conn, company_id, user_id):
+    return conn.execute('''
+        SELECT cu.*, u.role as user_role 
+        FROM company_users cu
+        JOIN users u ON u.id = cu.user_id
+        WHERE cu.company_id = ? AND cu.user_id = ? 
+        AND (cu.role IN ('owner', 'admin') OR u.role = 'executor')
+    ''', (company_id, user_id)).fetchone()
+
+# Helper function to run a query with a large IN (...) list in chunks.
+# params are bound before the IN values of every chunk.
+def fetch_in_chunks(conn, query, values, params=()):
+    rows = []
+    values = list(values)
+    for start in range(0, len(values), SQL_IN_CHUNK_SIZE):
+        chunk = values[start:start + SQL_IN_CHUNK_SIZE]
+        placeholders = ', '.join(['?'] * len(chunk))
+        rows.extend(conn.execute(query.format(placeholders=placeholders), list(params) + chunk).fetchall())
+    return rows
+
+# Helper function to hash passwords in parallel (pbkdf2 releases the GIL)
+def hash_passwords(passwords):
+    def hash_password(password):
+        return generate_password_hash(password, method='pbkdf2:sha256')
+    
+    if len(passwords) <= 1:
+        return [hash_password(password) for password in passwords]
+    
+    with ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS) as executor:
+        return list(executor.map(hash_password, passwords))
 
 # Get company details
 @companies_bp.route('/<int:company_id>', methods=['GET'])
 @token_required
 def get_company(current_user, company_id):
-    conn = get_db_connection()
     try:
         # Check if user belongs to company
-        company_user = conn.execute('''
-            SELECT * FROM company_users 
-            WHERE company_id = ? AND user_id = ?
-        ''', (company_id, current_user['id'])).fetchone()
+        company_user = company_repository.get_membership(company_id, current_user['id'])
         
         if not company_user:
             return jsonify({'error': 'Unauthorized access to company data'}), 403
         
         # Get company data
-        company = conn.execute('SELECT * FROM companies WHERE id = ?', (company_id,)).fetchone()
+        company = company_repository.get(company_id)
         
         if not company:
             return jsonify({'error': 'Company not found'}), 404
         
         # Get company employees
-        employees = conn.execute('''
-            SELECT u.id, u.email, u.role as user_role, u.phone, u.city, u.country, cu.role as company_role
-            FROM users u
-            JOIN company_users cu ON u.id = cu.user_id
-            WHERE cu.company_id = ?
-        ''', (company_id,)).fetchall()
-        
-        # Convert to dict for JSON serialization
-        company_dict = dict(company)
-        employees_list = [dict(employee) for employee in employees]
+        employees = company_repository.list_employees(company_id)
         
         return jsonify({
-            'company': company_dict,
-            'employees': employees_list
+            'company': company,
+            'employees': employees
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 # Update company details
 @companies_bp.route('/<int:company_id>', methods=['PUT'])
@@ -111,34 +159,17 @@ def add_employee(current_user, company_id):
     conn = get_db_connection()
     try:
         # Check if user is company owner or admin
-        company_user = conn.execute('''
-            SELECT cu.*, u.role as user_role 
-            FROM company_users cu
-            JOIN users u ON u.id = cu.user_id
-            WHERE cu.company_id = ? AND cu.user_id = ? 
-            AND (cu.role IN ('owner', 'admin') OR u.role = 'executor')
-        ''', (company_id, current_user['id'])).fetchone()
+        company_user = get_employee_manager(conn, company_id, current_user['id'])
         
         if not company_user:
             return jsonify({'error': 'Unauthorized to add employees'}), 403
         
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['email', 'password', 'role', 'company_role']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Validate roles
-        valid_user_roles = ['customer', 'executor']
-        valid_company_roles = ['admin', 'manager', 'employee']
-        
-        if data['role'] not in valid_user_roles:
-            return jsonify({'error': 'Invalid user role'}), 400
-        
-        if data['company_role'] not in valid_company_roles:
-            return jsonify({'error': 'Invalid company role'}), 400
+        # Validate required fields and roles
+        error = validate_employee_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Check if user already exists
         existing_user = conn.execute('SELECT * FROM users WHERE email = ?', (data['email'],)).fetchone()
@@ -204,6 +235,178 @@ def add_employee(current_user, company_id):
     finally:
         conn.close()
 
+# Helper function to onboard many employees in one transaction.
+# Returns the per-row results and a summary of what happened.
+def onboard_employees(conn, company_id, employees):
+    results = [None] * len(employees)
+    valid_rows = {}
+    
+    # Validate rows, the first occurrence of an email wins
+    for index, data in enumerate(employees):
+        if not isinstance(data, dict):
+            results[index] = {'row': index + 1, 'result': 'error', 'error': 'Row must be an object'}
+            continue
+        
+        error = validate_employee_data(data)
+        if not error and data['email'] in valid_rows:
+            error = 'Duplicate email in upload'
+        
+        if error:
+            results[index] = {'row': index + 1, 'email': data.get('email'), 'result': 'error', 'error': error}
+        else:
+            valid_rows[data['email']] = index
+    
+    # Resolve existing users and their memberships with one IN query per chunk
+    existing_users = {
+        row['email']: row for row in fetch_in_chunks(conn, '''
+            SELECT u.id, u.email, cu.id as membership_id
+            FROM users u
+            LEFT JOIN company_users cu ON cu.user_id = u.id AND cu.company_id = ?
+            WHERE u.email IN ({placeholders})
+        ''', valid_rows.keys(), (company_id,))
+    }
+    
+    new_emails = [email for email in valid_rows if email not in existing_users]
+    hashed_passwords = hash_passwords([employees[valid_rows[email]]['password'] for email in new_emails])
+    
+    # Create new users
+    conn.executemany('''
+        INSERT INTO users (email, password, role, phone, city, country) 
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        email,
+        hashed_password,
+        employees[valid_rows[email]]['role'],
+        employees[valid_rows[email]].get('phone', ''),
+        employees[valid_rows[email]].get('city', ''),
+        employees[valid_rows[email]].get('country', '')
+    ) for email, hashed_password in zip(new_emails, hashed_passwords)])
+    
+    created_ids = {
+        row['email']: row['id']
+        for row in fetch_in_chunks(conn, 'SELECT id, email FROM users WHERE email IN ({placeholders})', new_emails)
+    }
+    
+    # Executor profiles for new executors
+    conn.executemany('''
+        INSERT INTO executor_profiles (user_id, experience_level, points) 
+        VALUES (?, ?, ?)
+    ''', [
+        (created_ids[email], 'BEGINNER', 0)
+        for email in new_emails if employees[valid_rows[email]]['role'] == 'executor'
+    ])
+    
+    memberships = []
+    for email, index in valid_rows.items():
+        data = employees[index]
+        existing_user = existing_users.get(email)
+        
+        if existing_user and existing_user['membership_id']:
+            results[index] = {'row': index + 1, 'email': email, 'user_id': existing_user['id'],
+                              'result': 'error', 'error': 'User is already a member of this company'}
+            continue
+        
+        user_id = existing_user['id'] if existing_user else created_ids[email]
+        memberships.append((company_id, user_id, data['company_role']))
+        results[index] = {'row': index + 1, 'email': email, 'user_id': user_id,
+                          'result': 'added' if existing_user else 'created'}
+    
+    # Add all users to company
+    conn.executemany('''
+        INSERT INTO company_users (company_id, user_id, role) 
+        VALUES (?, ?, ?)
+    ''', memberships)
+    
+    summary = {
+        'total': len(employees),
+        'created': sum(1 for result in results if result['result'] == 'created'),
+        'added': sum(1 for result in results if result['result'] == 'added'),
+        'failed': sum(1 for result in results if result['result'] == 'error')
+    }
+    return results, summary
+
+# Add many employees to company
+@companies_bp.route('/<int:company_id>/employees/bulk', methods=['POST'])
+@token_required
+def bulk_add_employees(current_user, company_id):
+    data = request.get_json() or {}
+    employees = data.get('employees')
+    
+    if not isinstance(employees, list) or not employees:
+        return jsonify({'error': 'Missing employees'}), 400
+    
+    if len(employees) > BULK_ONBOARDING_MAX_ROWS:
+        return jsonify({'error': f'Cannot add more than {BULK_ONBOARDING_MAX_ROWS} employees at once'}), 400
+    
+    conn = get_db_connection()
+    try:
+        # Check if user is company owner or admin
+        company_user = get_employee_manager(conn, company_id, current_user['id'])
+        
+        if not company_user:
+            return jsonify({'error': 'Unauthorized to add employees'}), 403
+        
+        results, summary = onboard_employees(conn, company_id, employees)
+        conn.commit()
+        
+        return jsonify({
+            'message': 'Employees processed',
+            'summary': summary,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Add many employees to company from a CSV upload
+@companies_bp.route('/<int:company_id>/employees/import', methods=['POST'])
+@token_required
+def import_employees(current_user, company_id):
+    upload = request.files.get('file')
+    if upload:
+        content = upload.read()
+    else:
+        content = request.get_data()
+    
+    try:
+        reader = csv.DictReader(io.StringIO(content.decode('utf-8-sig')))
+        # Empty cells count as missing values
+        employees = [{k: v for k, v in row.items() if k and v not in (None, '')} for row in reader]
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f'Could not parse CSV: {e}'}), 400
+    
+    if not employees:
+        return jsonify({'error': 'Missing employees'}), 400
+    
+    if len(employees) > BULK_ONBOARDING_MAX_ROWS:
+        return jsonify({'error': f'Cannot add more than {BULK_ONBOARDING_MAX_ROWS} employees at once'}), 400
+    
+    conn = get_db_connection()
+    try:
+        # Check if user is company owner or admin
+        company_user = get_employee_manager(conn, company_id, current_user['id'])
+        
+        if not company_user:
+            return jsonify({'error': 'Unauthorized to add employees'}), 403
+        
+        results, summary = onboard_employees(conn, company_id, employees)
+        conn.commit()
+        
+        return jsonify({
+            'message': 'Employees processed',
+            'summary': summary,
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Remove employee from company
 @companies_bp.route('/<int:company_id>/employees/<int:user_id>', methods=['DELETE'])
 @token_required
@@ -293,9 +496,12 @@ def get_balance(current_user, company_id):
 # Add balance to company
 @companies_bp.route('/<int:company_id>/balance', methods=['POST'])
 @token_required
+@idempotent
 def add_balance(current_user, company_id):
-    conn = get_db_connection()
-    try:
+    data = request.get_json() or {}
+    
+    # Runs on the writer thread, so the max_balance check and update are one transaction
+    def write(conn):
         # Check if user is company owner or admin
         company_user = conn.execute('''
             SELECT cu.*, u.role as user_role 
@@ -306,24 +512,22 @@ def add_balance(current_user, company_id):
         ''', (company_id, current_user['id'])).fetchone()
         
         if not company_user:
-            return jsonify({'error': 'Unauthorized to add balance'}), 403
-        
-        data = request.get_json()
+            return {'error': 'Unauthorized to add balance'}, 403
         
         # Validate amount
         if 'amount' not in data or not isinstance(data['amount'], int) or data['amount'] <= 0:
-            return jsonify({'error': 'Invalid amount'}), 400
+            return {'error': 'Invalid amount'}, 400
         
         # Get current balance
         company = conn.execute('SELECT balance, max_balance FROM companies WHERE id = ?', (company_id,)).fetchone()
         
         if not company:
-            return jsonify({'error': 'Company not found'}), 404
+            return {'error': 'Company not found'}, 404
         
         # Check if adding balance would exceed max_balance
         new_balance = company['balance'] + data['amount']
         if new_balance > company['max_balance']:
-            return jsonify({'error': f'Balance cannot exceed maximum of {company["max_balance"]}'}), 400
+            return {'error': f'Balance cannot exceed maximum of {company["max_balance"]}'}, 400
         
         # Update company balance
         conn.execute('UPDATE companies SET balance = ? WHERE id = ?', (new_balance, company_id))
@@ -340,25 +544,29 @@ def add_balance(current_user, company_id):
             data.get('description', 'Company balance deposit')
         ))
         
-        conn.commit()
-        
-        return jsonify({
+        return {
             'message': 'Balance added successfully',
             'new_balance': new_balance
-        }), 200
+        }, 200
+    
+    try:
+        result, status = write_queue.submit(write)
+        return jsonify(result), status
         
+    except WriteUnavailable as e:
+        return write_unavailable_response(e)
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 # Add balance to employee
 @companies_bp.route('/<int:company_id>/employees/<int:user_id>/balance', methods=['POST'])
 @token_required
+@idempotent
 def add_employee_balance(current_user, company_id, user_id):
-    conn = get_db_connection()
-    try:
+    data = request.get_json() or {}
+    
+    # Runs on the writer thread, so the balance check and the transfer are one transaction
+    def write(conn):
         # Check if user is company owner or admin
         company_user = conn.execute('''
             SELECT cu.*, u.role as user_role 
@@ -369,7 +577,7 @@ def add_employee_balance(current_user, company_id, user_id):
         ''', (company_id, current_user['id'])).fetchone()
         
         if not company_user:
-            return jsonify({'error': 'Unauthorized to add employee balance'}), 403
+            return {'error': 'Unauthorized to add employee balance'}, 403
         
         # Check if target user belongs to company
         target_user = conn.execute('''
@@ -380,66 +588,223 @@ def add_employee_balance(current_user, company_id, user_id):
         ''', (company_id, user_id)).fetchone()
         
         if not target_user:
-            return jsonify({'error': 'User is not a member of this company'}), 404
-        
-        data = request.get_json()
+            return {'error': 'User is not a member of this company'}, 404
         
         # Validate amount
         if 'amount' not in data or not isinstance(data['amount'], int) or data['amount'] <= 0:
-            return jsonify({'error': 'Invalid amount'}), 400
+            return {'error': 'Invalid amount'}, 400
         
         # Get company balance
         company = conn.execute('SELECT balance FROM companies WHERE id = ?', (company_id,)).fetchone()
         
         if not company:
-            return jsonify({'error': 'Company not found'}), 404
+            return {'error': 'Company not found'}, 404
         
         # Check if company has enough balance
         if company['balance'] < data['amount']:
-            return jsonify({'error': 'Insufficient company balance'}), 400
+            return {'error': 'Insufficient company balance'}, 400
         
-        # Begin transaction
-        conn.execute('BEGIN TRANSACTION')
+        # Update company balance
+        new_company_balance = company['balance'] - data['amount']
+        conn.execute('UPDATE companies SET balance = ? WHERE id = ?', 
+                   (new_company_balance, company_id))
+        
+        # Update user balance
+        new_user_balance = target_user['balance'] + data['amount']
+        conn.execute('UPDATE users SET balance = ? WHERE id = ?', 
+                   (new_user_balance, user_id))
+        
+        # Record transaction
+        conn.execute('''
+            INSERT INTO balance_transactions (company_id, user_id, amount, transaction_type, description) 
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            company_id, 
+            user_id, 
+            data['amount'], 
+            'transfer', 
+            data.get('description', 'Balance transfer to employee')
+        ))
+        
+        return {
+            'message': 'Balance added to employee successfully',
+            'new_company_balance': new_company_balance,
+            'new_user_balance': new_user_balance
+        }, 200
+    
+    try:
+        result, status = write_queue.submit(write)
+        return jsonify(result), status
+        
+    except WriteUnavailable as e:
+        return write_unavailable_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper function to turn a distribution request into (user_id, amount) pairs.
+# Raises ValueError with a client-facing message if the request is invalid.
+def build_distribution(conn, company_id, data):
+    if not isinstance(data, dict):
+        raise ValueError('Invalid request body')
+    if 'equal_split' in data:
+        split = data['equal_split'] or {}
+        if not isinstance(split, dict):
+            raise ValueError('Invalid equal_split')
+        total = split.get('total')
+        if not isinstance(total, int) or isinstance(total, bool) or total <= 0:
+            raise ValueError('Invalid total')
+        
+        user_ids = split.get('user_ids')
+        if user_ids is None:
+            # Split between all members of the company
+            user_ids = [row['user_id'] for row in conn.execute(
+                'SELECT user_id FROM company_users WHERE company_id = ? ORDER BY user_id', (company_id,)
+            )]
+        if not isinstance(user_ids, list) or not user_ids:
+            raise ValueError('Missing user_ids')
+        if total < len(user_ids):
+            raise ValueError('Total is too small to split between all users')
+        
+        # The remainder goes one by one to the first users so the total is exact
+        share, remainder = divmod(total, len(user_ids))
+        transfers = [
+            {'user_id': user_id, 'amount': share + (1 if index < remainder else 0)}
+            for index, user_id in enumerate(user_ids)
+        ]
+    else:
+        transfers = data.get('transfers')
+        if not isinstance(transfers, list) or not transfers:
+            raise ValueError('Missing transfers')
+    
+    if len(transfers) > BALANCE_DISTRIBUTION_MAX_USERS:
+        raise ValueError(f'Cannot distribute to more than {BALANCE_DISTRIBUTION_MAX_USERS} users at once')
+    
+    pairs = []
+    seen = set()
+    for transfer in transfers:
+        if not isinstance(transfer, dict):
+            raise ValueError('Invalid transfer')
+        user_id = transfer.get('user_id')
+        amount = transfer.get('amount')
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            raise ValueError('Invalid user_id')
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+            raise ValueError(f'Invalid amount for user {user_id}')
+        if user_id in seen:
+            raise ValueError(f'Duplicate user_id: {user_id}')
+        seen.add(user_id)
+        pairs.append((user_id, amount))
+    
+    return pairs
+
+# Distribute company balance to many employees at once
+@companies_bp.route('/<int:company_id>/balance/distribute', methods=['POST'])
+@token_required
+@idempotent
+def distribute_balance(current_user, company_id):
+    data = request.get_json() or {}
+    
+    # Runs on the writer thread, so the balance check and the transfers are atomic
+    def write(conn):
+        # Check if user is company owner or admin
+        company_user = get_employee_manager(conn, company_id, current_user['id'])
+        
+        if not company_user:
+            return {'error': 'Unauthorized to add employee balance'}, 403
         
         try:
-            # Update company balance
-            new_company_balance = company['balance'] - data['amount']
-            conn.execute('UPDATE companies SET balance = ? WHERE id = ?', 
-                       (new_company_balance, company_id))
-            
-            # Update user balance
-            new_user_balance = target_user['balance'] + data['amount']
-            conn.execute('UPDATE users SET balance = ? WHERE id = ?', 
-                       (new_user_balance, user_id))
-            
-            # Record transaction
-            conn.execute('''
-                INSERT INTO balance_transactions (company_id, user_id, amount, transaction_type, description) 
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                company_id, 
-                user_id, 
-                data['amount'], 
-                'transfer', 
-                data.get('description', 'Balance transfer to employee')
-            ))
-            
-            conn.commit()
-            
-            return jsonify({
-                'message': 'Balance added to employee successfully',
-                'new_company_balance': new_company_balance,
-                'new_user_balance': new_user_balance
-            }), 200
-            
-        except Exception as e:
-            conn.rollback()
-            raise e
+            pairs = build_distribution(conn, company_id, data)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        
+        # Check that all targets belong to company with one query per chunk
+        member_ids = {
+            row['user_id'] for row in fetch_in_chunks(conn, '''
+                SELECT user_id FROM company_users
+                WHERE company_id = ? AND user_id IN ({placeholders})
+            ''', [user_id for user_id, _ in pairs], (company_id,))
+        }
+        non_members = [user_id for user_id, _ in pairs if user_id not in member_ids]
+        if non_members:
+            return {
+                'error': 'Some users are not members of this company',
+                'user_ids': non_members
+            }, 404
+        
+        # Check the total against the company balance once
+        company = conn.execute('SELECT balance FROM companies WHERE id = ?', (company_id,)).fetchone()
+        
+        if not company:
+            return {'error': 'Company not found'}, 404
+        
+        total = sum(amount for _, amount in pairs)
+        if company['balance'] < total:
+            return {
+                'error': 'Insufficient company balance',
+                'required': total,
+                'current': company['balance']
+            }, 400
+        
+        description = data.get('description', 'Balance transfer to employee')
+        
+        # Update company balance
+        new_company_balance = company['balance'] - total
+        conn.execute('UPDATE companies SET balance = ? WHERE id = ?', 
+                   (new_company_balance, company_id))
+        
+        # Update user balances
+        conn.executemany('UPDATE users SET balance = balance + ? WHERE id = ?', 
+                       [(amount, user_id) for user_id, amount in pairs])
+        
+        # Record transactions
+        conn.executemany('''
+            INSERT INTO balance_transactions (company_id, user_id, amount, transaction_type, description) 
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(company_id, user_id, amount, 'transfer', description) for user_id, amount in pairs])
+        
+        return {
+            'message': 'Balance distributed successfully',
+            'total': total,
+            'new_company_balance': new_company_balance,
+            'transfers': [{'user_id': user_id, 'amount': amount} for user_id, amount in pairs]
+        }, 200
+    
+    try:
+        result, status = write_queue.submit(write)
+        return jsonify(result), status
         
+    except WriteUnavailable as e:
+        return write_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
+
+# Export company listings, responses, transactions or activity log
+@companies_bp.route('/<int:company_id>/export/<entity>', methods=['GET'])
+@token_required
+def export_company_data(current_user, company_id, entity):
+    try:
+        query, params = build_export_query(entity, request.args, company_id)
+        fmt = get_export_format(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    try:
+        # Check if user is company owner or admin
+        company_user = conn.execute('''
+            SELECT * FROM company_users 
+            WHERE company_id = ? AND user_id = ? AND role IN ('owner', 'admin')
+        ''', (company_id, current_user['id'])).fetchone()
+        
+        if not company_user:
+            conn.close()
+            return jsonify({'error': 'Unauthorized to export company data'}), 403
+        
+        # The streamed response closes the connection when it is done
+        return stream_export(conn, query, params, fmt, entity, wants_gzip(request.args))
+    except Exception as e:
         conn.close()
+        return jsonify({'error': str(e)}), 500
 
 # Reset employee password
 @companies_bp.route('/<int:company_id>/employees/<int:user_id>/reset-password', methods=['POST'])
@@ -0,0 +1,49 @@
+"""
+Event stream routes for the Metal-Rezerv API.
+Pushes response and listing events to the browser as Server-Sent Events.
+"""
+
+from flask import Blueprint, Response, request, stream_with_context
+from src.utils.auth_middleware import stream_token_required
+from src.utils.events import hub, format_sse
+
+events_bp = Blueprint('events', __name__)
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+# Stream events of the current user
+@events_bp.route('/stream', methods=['GET'])
+@stream_token_required
+def stream_events(current_user):
+    # Resume after the last event the client has seen, otherwise start from now
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else hub.last_id
+    except ValueError:
+        last_id = hub.last_id
+    
+    user_id = current_user['id']
+    
+    def generate(last_id):
+        # Reconnect delay for the browser, in milliseconds
+        yield 'retry: 3000\n\n'
+        
+        while True:
+            events, newest_id, missed = hub.read(user_id, last_id)
+            
+            if missed:
+                # Older events were dropped, the client has to reload its data
+                yield format_sse(newest_id, 'resync', {})
+            
+            for event_id, event_type, data in events:
+                yield format_sse(event_id, event_type, data)
+            last_id = newest_id
+            
+            if not hub.wait(last_id, HEARTBEAT_INTERVAL):
+                yield ': keep-alive\n\n'
+    
+    response = Response(stream_with_context(generate(last_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
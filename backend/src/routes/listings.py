@@ -5,20 +5,187 @@ Handles creation, management and retrieval of listings.
 
 import sqlite3
 import os
+import csv
+import json
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from src.utils.auth_middleware import token_required
+from src.utils.http_cache import get_validators, is_not_modified, add_validators, not_modified_response
+from src.utils.changes import InvalidSyncToken, parse_changes_args, get_changes
+from src.utils.events import publish_event
+from src.utils.subscription_index import subscription_index
+from src.utils.feed import feed_cache
+from src.utils.db import connect
+from src.utils.fast_json import json_response
+from src.utils.archive import ARCHIVE_COLUMNS
+from src.utils.projections import get_requested_fields, build_select_list
 
 listings_bp = Blueprint('listings', __name__)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
 
+# Fields every new listing must provide (single and bulk creation)
+LISTING_REQUIRED_FIELDS = ['title', 'category', 'purchase_method', 'payment_terms',
+                           'listing_type', 'delivery_date', 'publication_period']
+
+# Bulk import settings
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_ERRORS = 1000
+
+# Date window filters: query parameter -> (column, comparison)
+DATE_FILTERS = {
+    'delivery_from': ('delivery_date', '>='),
+    'delivery_to': ('delivery_date', '<='),
+    'purchase_from': ('purchase_date', '>='),
+    'purchase_to': ('purchase_date', '<=')
+}
+
+# Columns listings can be sorted by
+LISTING_SORT_COLUMNS = ['created_at', 'delivery_date', 'purchase_date']
+
+# Named projections of list endpoints (see ?view= and ?fields=)
+LISTING_VIEWS = {
+    'summary': ['id', 'title', 'category', 'description_preview', 'delivery_date', 'purchase_date',
+                'status', 'city', 'country', 'user_id', 'created_at'],
+    'full': ARCHIVE_COLUMNS['listings']
+}
+
+# Calendar settings
+CALENDAR_FIELDS = ['delivery_date', 'purchase_date']
+CALENDAR_DEFAULT_DAYS = 30
+CALENDAR_MAX_DAYS = 366
+
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
+
+# Helper function to get the company of a user (None if the user has no company)
+def get_user_company_id(conn, user_id):
+    company = conn.execute('''
+        SELECT c.id FROM companies c
+        JOIN company_users cu ON c.id = cu.company_id
+        WHERE cu.user_id = ?
+    ''', (user_id,)).fetchone()
+    return company['id'] if company else None
+
+# Helper function to get the default location of a user's listings
+def get_owner_location(conn, user_id):
+    owner = conn.execute('SELECT city, country FROM users WHERE id = ?', (user_id,)).fetchone()
+    return (owner['city'], owner['country']) if owner else (None, None)
+
+# Helper function to build the INSERT values of a new listing.
+# location is the (city, country) used when the data has none.
+# Raises ValueError with a client-facing message if the data is invalid.
+def build_listing_values(data, user_id, company_id, location):
+    for field in LISTING_REQUIRED_FIELDS:
+        if field not in data:
+            raise ValueError(f'Missing required field: {field}')
+    
+    try:
+        delivery_date = datetime.strptime(data['delivery_date'], '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError('Invalid delivery_date, expected YYYY-MM-DD')
+    
+    # Calculate purchase date based on delivery date if not provided
+    purchase_date = data.get('purchase_date')
+    if not purchase_date:
+        # Default to 7 days before delivery
+        purchase_date = (delivery_date - timedelta(days=7)).strftime('%Y-%m-%d')
+    
+    return (
+        data['title'],
+        data.get('description', ''),
+        data['category'],
+        data['purchase_method'],
+        data['payment_terms'],
+        data['listing_type'],
+        data['delivery_date'],
+        purchase_date,
+        data['publication_period'],
+        'published',
+        user_id,
+        company_id,
+        data.get('city') or location[0],
+        data.get('country') or location[1]
+    )
+
+# Helper function to put new-listing notifications into subscribers' inboxes.
+# listings is a list of (listing_id, title, category, city, country) published by owner_id.
+# Returns the (user_id, listing_id) pairs to publish once the transaction commits.
+def notify_subscribers(conn, owner_id, listings):
+    subscription_index.ensure_fresh(conn)
+    
+    notifications = []
+    for listing_id, title, category, city, country in listings:
+        for user_id in subscription_index.lookup(category, city, country):
+            if user_id != owner_id:
+                notifications.append((user_id, listing_id, 'new_listing', f"New listing: {title}"))
+    
+    conn.executemany('''
+        INSERT INTO notifications (user_id, listing_id, type, message)
+        VALUES (?, ?, ?, ?)
+    ''', notifications)
+    
+    return [(user_id, listing_id) for user_id, listing_id, _, _ in notifications]
+
+# Helper function to push new-listing events to subscribers after commit
+def publish_new_listings(deliveries):
+    subscribers = {}
+    for user_id, listing_id in deliveries:
+        subscribers.setdefault(listing_id, []).append(user_id)
+    for listing_id, user_ids in subscribers.items():
+        publish_event('new_listing', {'listing_id': listing_id}, user_ids)
+
+# Helper function to map the selectable listing fields to their columns
+def listing_fields(prefix=''):
+    return {column: f'{prefix}{column}' for column in ARCHIVE_COLUMNS['listings']}
+
+# Helper function to parse a YYYY-MM-DD query parameter (None if absent)
+def parse_date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Invalid {name}, expected YYYY-MM-DD')
+
+# Helper function to build the date window conditions of a listing query.
+# Returns (sql, params) where sql is a string of ' AND ...' conditions.
+# Raises ValueError with a client-facing message if a date is invalid.
+def build_date_filters(args, prefix=''):
+    sql = ''
+    params = []
+    for name, (column, comparison) in DATE_FILTERS.items():
+        value = parse_date_arg(args, name)
+        if value:
+            sql += f' AND {prefix}{column} {comparison} ?'
+            params.append(value)
+    return sql, params
+
+# Helper function to build the ORDER BY clause of a listing query.
+# Raises ValueError with a client-facing message if the sort is invalid.
+def build_listing_order(args, prefix=''):
+    sort = args.get('sort', 'created_at')
+    if sort not in LISTING_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort, expected one of: {', '.join(LISTING_SORT_COLUMNS)}")
+    
+    # Newest first by default, soonest first for dates
+    default_order = 'desc' if sort == 'created_at' else 'asc'
+    order = args.get('order', default_order).lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError('Invalid order, expected asc or desc')
+    
+    return f' ORDER BY {prefix}{sort} {order.upper()}, {prefix}id {order.upper()}'
+
+INSERT_LISTING_SQL = '''
+    INSERT INTO listings (
+        title, description, category, purchase_method, payment_terms,
+        listing_type, delivery_date, purchase_date, publication_period,
+        status, user_id, company_id, city, country
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
 
 # Get all listings (with filters)
 @listings_bp.route('', methods=['GET'])
@@ -27,18 +194,42 @@ def get_listings(current_user):
     # Parse query parameters
     category = request.args.get('category')
     status = request.args.get('status', 'published')
+    city = request.args.get('city')
+    country = request.args.get('country')
+    near_me = request.args.get('near_me', '').lower() in ('1', 'true', 'yes')
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 10))
     
     # Calculate offset
     offset = (page - 1) * per_page
     
+    try:
+        date_sql, date_params = build_date_filters(request.args)
+        listing_date_sql = build_date_filters(request.args, 'l.')[0]
+        order_sql = build_listing_order(request.args, 'l.')
+        fields = get_requested_fields(request.args, listing_fields(), LISTING_VIEWS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
     try:
-        # Build query based on filters
-        query = '''
+        # Answer conditional requests before running the page query
+        tables = ['listings', 'responses', 'users'] if near_me else ['listings', 'responses']
+        validators = get_validators(conn, tables, current_user['id'], request.full_path)
+        if is_not_modified(validators):
+            return not_modified_response(validators)
+        
+        # "Near me" uses the location from the caller's profile
+        if near_me:
+            city, country = get_owner_location(conn, current_user['id'])
+            # A city is only meaningful together with its country
+            if not country:
+                city = None
+        
+        # Build query based on filters, selecting only the requested fields
+        query = f'''
             SELECT 
-                l.*,
+                {build_select_list(fields, listing_fields('l.'))},
                 CASE 
                     WHEN r.id IS NOT NULL THEN 1 
                     ELSE 0 
@@ -53,8 +244,19 @@ def get_listings(current_user):
             query += ' AND l.category = ?'
             params.append(category)
         
+        if country:
+            query += ' AND l.country = ?'
+            params.append(country)
+        
+        if city:
+            query += ' AND l.city = ?'
+            params.append(city)
+        
+        query += listing_date_sql
+        params.extend(date_params)
+        
         # Add pagination
-        query += ' ORDER BY l.created_at DESC LIMIT ? OFFSET ?'
+        query += order_sql + ' LIMIT ? OFFSET ?'
         params.extend([per_page, offset])
         
         # Execute query
@@ -68,10 +270,73 @@ def get_listings(current_user):
             count_query += ' AND category = ?'
             count_params.append(category)
         
+        if country:
+            count_query += ' AND country = ?'
+            count_params.append(country)
+        
+        if city:
+            count_query += ' AND city = ?'
+            count_params.append(city)
+        
+        count_query += date_sql
+        count_params.extend(date_params)
+        
         total = conn.execute(count_query, count_params).fetchone()['count']
         
-        # Convert to list of dicts for JSON serialization
-        listings_list = [dict(listing) for listing in listings]
+        # Rows are serialized directly by the fast JSON encoder
+        return add_validators(json_response({
+            'listings': listings,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'total_pages': (total + per_page - 1) // per_page
+        }), validators), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get personalized listing feed of an executor, best matches first
+@listings_bp.route('/feed', methods=['GET'])
+@token_required
+def get_listing_feed(current_user):
+    if current_user['role'] != 'executor':
+        return jsonify({'error': 'Only executors have a listing feed'}), 403
+    
+    # Parse query parameters
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', 10))
+    
+    # Calculate offset
+    offset = (page - 1) * per_page
+    
+    conn = get_db_connection()
+    try:
+        ranked, total = feed_cache.get(current_user['id']).page(conn, offset, per_page)
+        
+        listings_list = []
+        if ranked:
+            # Read only the listings of the page
+            ids = [listing_id for listing_id, _ in ranked]
+            placeholders = ', '.join(['?'] * len(ids))
+            rows = {row['id']: row for row in conn.execute(f'''
+                SELECT 
+                    l.*,
+                    CASE 
+                        WHEN r.id IS NOT NULL THEN 1 
+                        ELSE 0 
+                    END as has_responded
+                FROM listings l
+                LEFT JOIN responses r ON l.id = r.listing_id AND r.user_id = ?
+                WHERE l.id IN ({placeholders})
+            ''', [current_user['id']] + ids)}
+            
+            for listing_id, score in ranked:
+                if listing_id in rows:
+                    listing = dict(rows[listing_id])
+                    listing['score'] = round(score, 4)
+                    listings_list.append(listing)
         
         return jsonify({
             'listings': listings_list,
@@ -86,12 +351,104 @@ def get_listings(current_user):
     finally:
         conn.close()
 
+# Get per-day listing counts of a delivery or purchase date window
+@listings_bp.route('/calendar', methods=['GET'])
+@token_required
+def get_listing_calendar(current_user):
+    field = request.args.get('field', 'delivery_date')
+    if field not in CALENDAR_FIELDS:
+        return jsonify({'error': f"Invalid field, expected one of: {', '.join(CALENDAR_FIELDS)}"}), 400
+    
+    try:
+        date_from = parse_date_arg(request.args, 'from') or datetime.now().strftime('%Y-%m-%d')
+        date_to = parse_date_arg(request.args, 'to')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    start = datetime.strptime(date_from, '%Y-%m-%d')
+    if not date_to:
+        date_to = (start + timedelta(days=CALENDAR_DEFAULT_DAYS - 1)).strftime('%Y-%m-%d')
+    days = (datetime.strptime(date_to, '%Y-%m-%d') - start).days + 1
+    if days < 1 or days > CALENDAR_MAX_DAYS:
+        return jsonify({'error': f'Date window must span 1 to {CALENDAR_MAX_DAYS} days'}), 400
+    
+    mine = request.args.get('mine', '').lower() in ('1', 'true', 'yes')
+    category = request.args.get('category')
+    status = request.args.get('status', None if mine else 'published')
+    
+    conn = get_db_connection()
+    try:
+        # Answer conditional requests before running the aggregation
+        validators = get_validators(conn, ['listings'], current_user['id'], request.full_path)
+        if is_not_modified(validators):
+            return not_modified_response(validators)
+        
+        # Count per day in SQL, served by the (status|user_id, date) indexes
+        query = f'SELECT {field} as day, COUNT(*) as count FROM listings WHERE {field} BETWEEN ? AND ?'
+        params = [date_from, date_to]
+        
+        if mine:
+            query += ' AND user_id = ?'
+            params.append(current_user['id'])
+        
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        
+        if category:
+            query += ' AND category = ?'
+            params.append(category)
+        
+        query += f' GROUP BY {field} ORDER BY {field}'
+        
+        counts = conn.execute(query, params).fetchall()
+        
+        return add_validators(json_response({
+            'field': field,
+            'from': date_from,
+            'to': date_to,
+            'days': counts,
+            'total': sum(row['count'] for row in counts)
+        }), validators), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get ids of listings inserted, updated or deleted since a sync token
+@listings_bp.route('/changes', methods=['GET'])
+@token_required
+def get_listing_changes(current_user):
+    conn = get_db_connection()
+    try:
+        since, limit = parse_changes_args(request.args)
+        
+        # Only the user's own listings if requested
+        where, params = None, ()
+        if request.args.get('mine', '').lower() in ('1', 'true', 'yes'):
+            where, params = 'user_id = ?', (current_user['id'],)
+        
+        return jsonify(get_changes(conn, 'listings', since, limit, where, params)), 200
+        
+    except InvalidSyncToken as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Get listing by ID
 @listings_bp.route('/<int:listing_id>', methods=['GET'])
 @token_required
 def get_listing(current_user, listing_id):
     conn = get_db_connection()
     try:
+        # Answer conditional requests before running the listing queries
+        validators = get_validators(conn, ['listings', 'responses', 'users'], current_user['id'], listing_id)
+        if is_not_modified(validators):
+            return not_modified_response(validators)
+        
         # Get listing with has_responded flag
         listing = conn.execute('''
             SELECT 
@@ -131,11 +488,11 @@ def get_listing(current_user, listing_id):
         owner_dict = dict(owner) if owner else None
         responses_dict = dict(responses_count)
         
-        return jsonify({
+        return add_validators(jsonify({
             'listing': listing_dict,
             'owner': owner_dict,
             'responses': responses_dict
-        }), 200
+        }), validators), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -149,51 +506,23 @@ def create_listing(current_user):
     data = request.get_json()
     
     # Validate required fields
-    required_fields = ['title', 'category', 'purchase_method', 'payment_terms', 
-                      'listing_type', 'delivery_date', 'publication_period']
-    for field in required_fields:
+    for field in LISTING_REQUIRED_FIELDS:
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
     conn = get_db_connection()
     try:
         # Get user's company if exists
-        company = conn.execute('''
-            SELECT c.id FROM companies c
-            JOIN company_users cu ON c.id = cu.company_id
-            WHERE cu.user_id = ?
-        ''', (current_user['id'],)).fetchone()
+        company_id = get_user_company_id(conn, current_user['id'])
         
-        company_id = company['id'] if company else None
-        
-        # Calculate purchase date based on delivery date if not provided
-        purchase_date = data.get('purchase_date')
-        if not purchase_date:
-            # Default to 7 days before delivery
-            delivery_date = datetime.strptime(data['delivery_date'], '%Y-%m-%d')
-            purchase_date = (delivery_date - timedelta(days=7)).strftime('%Y-%m-%d')
+        try:
+            values = build_listing_values(data, current_user['id'], company_id,
+                                          get_owner_location(conn, current_user['id']))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Insert listing
-        cursor = conn.execute('''
-            INSERT INTO listings (
-                title, description, category, purchase_method, payment_terms,
-                listing_type, delivery_date, purchase_date, publication_period,
-                status, user_id, company_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['title'],
-            data.get('description', ''),
-            data['category'],
-            data['purchase_method'],
-            data['payment_terms'],
-            data['listing_type'],
-            data['delivery_date'],
-            purchase_date,
-            data['publication_period'],
-            'published',
-            current_user['id'],
-            company_id
-        ))
+        cursor = conn.execute(INSERT_LISTING_SQL, values)
         
         listing_id = cursor.lastrowid
         
@@ -208,8 +537,15 @@ def create_listing(current_user):
             f"Created listing: {data['title']}"
         ))
         
+        # Notify executors subscribed to the category and region
+        deliveries = notify_subscribers(conn, current_user['id'], [
+            (listing_id, data['title'], data['category'], values[12], values[13])
+        ])
+        
         conn.commit()
         
+        publish_new_listings(deliveries)
+        
         return jsonify({
             'message': 'Listing created successfully',
             'listing_id': listing_id
@@ -221,6 +557,168 @@ def create_listing(current_user):
     finally:
         conn.close()
 
+# Helper function to detect the format of a bulk import upload
+def get_import_format(upload):
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    
+    mimetype = upload.mimetype if upload else request.mimetype
+    filename = (upload.filename or '') if upload else ''
+    if mimetype in ('text/csv', 'application/csv') or filename.endswith('.csv'):
+        return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl') \
+            or filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+# Helper generator yielding decoded lines of an upload without reading it whole
+def iter_upload_lines(stream):
+    for raw_line in iter(stream.readline, b''):
+        yield raw_line.decode('utf-8-sig')
+
+# Helper generator yielding (row_number, data, error) for every row of an upload
+def iter_import_rows(lines, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row_number, row in enumerate(reader, start=1):
+            # Empty cells count as missing values, like absent JSON keys
+            yield row_number, {k: v for k, v in row.items() if k and v not in (None, '')}, None
+    else:
+        row_number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield row_number, None, 'Invalid JSON'
+                continue
+            if not isinstance(data, dict):
+                yield row_number, None, 'Row must be a JSON object'
+                continue
+            yield row_number, data, None
+
+# Bulk import listings from a streamed CSV or NDJSON upload
+@listings_bp.route('/import', methods=['POST'])
+@token_required
+def import_listings(current_user):
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    
+    # Accept either a multipart file upload or a raw request body
+    upload = None
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'Missing file'}), 400
+    
+    fmt = get_import_format(upload)
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Unsupported format. Use CSV or NDJSON'}), 400
+    
+    stream = upload.stream if upload else request.stream
+    
+    conn = get_db_connection()
+    try:
+        company_id = get_user_company_id(conn, current_user['id'])
+        location = get_owner_location(conn, current_user['id'])
+        
+        imported = 0
+        failed = 0
+        errors = []
+        chunk = []
+        chunk_rows = []
+        
+        def add_error(row_number, message):
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({'row': row_number, 'error': message})
+        
+        def flush_chunk():
+            if not chunk:
+                return 0
+            try:
+                conn.executemany(INSERT_LISTING_SQL, chunk)
+                conn.execute('''
+                    INSERT INTO activity_log (user_id, company_id, action_type, description)
+                    VALUES (?, ?, ?, ?)
+                ''', (
+                    current_user['id'],
+                    company_id,
+                    'import_listings',
+                    f"Imported {len(chunk)} listings"
+                ))
+                
+                # Ids of the rows just inserted: nobody else can insert while this transaction writes
+                listing_ids = [row['id'] for row in conn.execute('''
+                    SELECT id FROM listings WHERE user_id = ? ORDER BY id DESC LIMIT ?
+                ''', (current_user['id'], len(chunk)))]
+                listing_ids.reverse()
+                deliveries = notify_subscribers(conn, current_user['id'], [
+                    (listing_id, values[0], values[2], values[12], values[13])
+                    for listing_id, values in zip(listing_ids, chunk)
+                ])
+                
+                conn.commit()
+                publish_new_listings(deliveries)
+                return len(chunk)
+            except sqlite3.Error as e:
+                conn.rollback()
+                for row_number in chunk_rows:
+                    add_error(row_number, str(e))
+                return 0
+            finally:
+                del chunk[:]
+                del chunk_rows[:]
+        
+        try:
+            for row_number, data, error in iter_import_rows(iter_upload_lines(stream), fmt):
+                if error is None:
+                    try:
+                        values = build_listing_values(data, current_user['id'], company_id, location)
+                    except ValueError as e:
+                        error = str(e)
+                
+                if error is not None:
+                    failed += 1
+                    add_error(row_number, error)
+                    continue
+                
+                if dry_run:
+                    imported += 1
+                    continue
+                
+                chunk.append(values)
+                chunk_rows.append(row_number)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    count = len(chunk)
+                    inserted = flush_chunk()
+                    imported += inserted
+                    failed += count - inserted
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Rows read so far are still imported, the rest of the file is rejected
+            add_error(None, f'Could not parse upload: {e}')
+        
+        count = len(chunk)
+        inserted = flush_chunk()
+        imported += inserted
+        failed += count - inserted
+        
+        return jsonify({
+            'message': 'Import validated' if dry_run else 'Import finished',
+            'dry_run': dry_run,
+            'imported': imported,
+            'failed': failed,
+            'errors': errors,
+            'errors_truncated': failed > len(errors)
+        }), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Update listing
 @listings_bp.route('/<int:listing_id>', methods=['PUT'])
 @token_required
@@ -241,7 +739,8 @@ def update_listing(current_user, listing_id):
         # Fields that can be updated
         allowed_fields = ['title', 'description', 'category', 'purchase_method', 
                          'payment_terms', 'listing_type', 'delivery_date', 
-                         'purchase_date', 'publication_period', 'status']
+                         'purchase_date', 'publication_period', 'status',
+                         'city', 'country']
         update_data = {k: v for k, v in data.items() if k in allowed_fields}
         
         if not update_data:
@@ -326,38 +825,60 @@ def get_my_listings(current_user):
     # Calculate offset
     offset = (page - 1) * per_page
     
+    try:
+        date_sql, date_params = build_date_filters(request.args)
+        order_sql = build_listing_order(request.args)
+        fields = get_requested_fields(request.args, listing_fields(), LISTING_VIEWS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
     try:
-        # Build query based on filters
-        query = 'SELECT * FROM listings WHERE user_id = ?'
-        params = [current_user['id']]
+        # Build filters shared by the hot and the archived listings
+        where = 'WHERE user_id = ?'
+        where_params = [current_user['id']]
         
         if status:
-            query += ' AND status = ?'
-            params.append(status)
+            where += ' AND status = ?'
+            where_params.append(status)
+        
+        where += date_sql
+        where_params.extend(date_params)
+        
+        # Completed listings may already have been moved to the archive
+        include_archive = status in (None, '', 'completed')
+        
+        # The UNION can only be ordered by selected columns
+        sort = request.args.get('sort', 'created_at')
+        if sort not in fields:
+            fields.append(sort)
+        
+        columns = build_select_list(fields, listing_fields())
+        query = f'SELECT {columns}, 0 as archived FROM listings {where}'
+        params = list(where_params)
+        
+        if include_archive:
+            query += f' UNION ALL SELECT {columns}, 1 as archived FROM listings_archive {where}'
+            params.extend(where_params)
         
         # Add pagination
-        query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
+        query += order_sql + ' LIMIT ? OFFSET ?'
         params.extend([per_page, offset])
         
         # Execute query
         listings = conn.execute(query, params).fetchall()
         
         # Count total listings for pagination
-        count_query = 'SELECT COUNT(*) as count FROM listings WHERE user_id = ?'
-        count_params = [current_user['id']]
+        total = conn.execute(f'SELECT COUNT(*) as count FROM listings {where}', where_params).fetchone()['count']
         
-        if status:
-            count_query += ' AND status = ?'
-            count_params.append(status)
-        
-        total = conn.execute(count_query, count_params).fetchone()['count']
+        if include_archive:
+            total += conn.execute(
+                f'SELECT COUNT(*) as count FROM listings_archive {where}', where_params
+            ).fetchone()['count']
         
-        # Convert to list of dicts for JSON serialization
-        listings_list = [dict(listing) for listing in listings]
-        
-        return jsonify({
-            'listings': listings_list,
+        # Rows are serialized directly by the fast JSON encoder
+        return json_response({
+            'listings': listings,
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -439,11 +960,18 @@ def get_my_listings_statistics(current_user):
             FROM responses
             WHERE listing_id IN (SELECT id FROM listings WHERE user_id = ?)
         ''', (current_user['id'],)).fetchone()
+        # Archived listings are all completed
+        archived = conn.execute('''
+            SELECT 
+                (SELECT COUNT(*) FROM listings_archive WHERE user_id = ?) as listings,
+                (SELECT COUNT(*) FROM responses_archive
+                 WHERE listing_id IN (SELECT id FROM listings_archive WHERE user_id = ?)) as responses
+        ''', (current_user['id'], current_user['id'])).fetchone()
         return jsonify({
-            'totalListings': stats['total_listings'],
+            'totalListings': stats['total_listings'] + archived['listings'],
             'activeListings': stats['active_listings'],
-            'completedListings': stats['completed_listings'],
-            'totalResponses': responses['total_responses']
+            'completedListings': (stats['completed_listings'] or 0) + archived['listings'],
+            'totalResponses': responses['total_responses'] + archived['responses']
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -487,6 +1015,12 @@ def complete_listing_with_review(current_user, listing_id):
             VALUES (?, ?, ?, ?, ?)
         ''', (listing_id, current_user['id'], executor_id, rating, review_text))
         conn.commit()
+        publish_event('listing_completed', {
+            'listing_id': listing_id,
+            'response_id': response['id'],
+            'executor_id': response['user_id'],
+            'status': 'accepted'
+        }, [response['user_id'], current_user['id']])
         return jsonify({'message': 'Listing completed and review submitted'}), 200
     except Exception as e:
         conn.rollback()
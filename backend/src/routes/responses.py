@@ -3,26 +3,69 @@ Responses (job applications) routes for the Metal-Rezerv API.
 Handles creation, management and retrieval of responses to listings.
 """
 
-import sqlite3
 import os
 from flask import Blueprint, request, jsonify
 from src.utils.auth_middleware import token_required
+from src.utils.http_cache import get_validators, is_not_modified, add_validators, not_modified_response
+from src.utils.changes import InvalidSyncToken, parse_changes_args, get_changes
+from src.utils.events import publish_event
+from src.utils.subscription_index import normalize
+from src.utils.db import connect
+from src.utils.fast_json import json_response
+from src.utils.projections import get_requested_fields, build_select_list
+from src.utils.archive import archive_columns
+from src.utils.write_queue import write_queue, WriteUnavailable, write_unavailable_response
+from src.utils.rate_limit import rate_limit
+from src.utils.idempotency import idempotent
 
 responses_bp = Blueprint('responses', __name__)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
 
+# Selectable fields of listing responses and the columns they are read from
+RESPONSE_FIELDS = {
+    'id': 'r.id',
+    'listing_id': 'r.listing_id',
+    'user_id': 'r.user_id',
+    'company_id': 'r.company_id',
+    'status': 'r.status',
+    'message': 'r.message',
+    'created_at': 'r.created_at',
+    'updated_at': 'r.updated_at',
+    'email': 'u.email',
+    'phone': 'u.phone',
+    'city': 'u.city',
+    'country': 'u.country',
+    'experience_level': 'ep.experience_level',
+    'points': 'ep.points',
+    'spent_points': 'ep.spent_points',
+    'executor_score': 'es.score',
+    'review_count': 'es.review_count',
+    'completed_jobs': 'es.completed_jobs',
+    'average_rating': 'CASE WHEN es.review_count > 0 THEN 1.0 * es.rating_sum / es.review_count END'
+}
+
+# Named projections of listing responses (see ?view= and ?fields=)
+RESPONSE_VIEWS = {
+    'summary': ['id', 'user_id', 'status', 'created_at', 'email', 'city', 'country',
+                'experience_level', 'executor_score', 'review_count', 'average_rating'],
+    'full': list(RESPONSE_FIELDS)
+}
+
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
 
 # Get responses for a listing
 @responses_bp.route('/listings/<int:listing_id>/responses', methods=['GET'])
 @token_required
 def get_listing_responses(current_user, listing_id):
+    try:
+        fields = get_requested_fields(request.args, RESPONSE_FIELDS, RESPONSE_VIEWS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
     try:
         # Check if user has access to the listing (same company)
@@ -38,29 +81,92 @@ def get_listing_responses(current_user, listing_id):
         
         print(f"Found listing {listing_id} for user {current_user['id']}")
         
-        # Get responses
-        responses = conn.execute('''
-            SELECT r.*, u.email, u.phone, u.city, u.country,
-                   ep.experience_level, ep.points, ep.spent_points
+        # Best ranked executors first, unless the newest responses are requested
+        if request.args.get('sort') == 'recent':
+            order_by = 'r.created_at DESC'
+        else:
+            order_by = 'COALESCE(es.score, 0) DESC, r.created_at DESC'
+        
+        # Get the requested fields with the precomputed executor reputation
+        responses = conn.execute(f'''
+            SELECT {build_select_list(fields, RESPONSE_FIELDS)}
             FROM responses r
             JOIN users u ON r.user_id = u.id
             LEFT JOIN executor_profiles ep ON u.id = ep.user_id
+            LEFT JOIN executor_stats es ON es.user_id = r.user_id
             WHERE r.listing_id = ?
-            ORDER BY r.created_at DESC
+            ORDER BY {order_by}
         ''', (listing_id,)).fetchall()
         
         print(f"Found {len(responses)} responses for listing {listing_id}")
         
-        # Convert to list of dicts for JSON serialization
-        responses_list = [dict(response) for response in responses]
+        # Rows are serialized directly by the fast JSON encoder
+        return json_response({
+            'responses': responses,
+            'count': len(responses)
+        }), 200
+        
+    except Exception as e:
+        print(f"Error getting responses for listing {listing_id}:", str(e))
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get top executors matching a listing who have not responded yet
+@responses_bp.route('/listings/<int:listing_id>/suggested-executors', methods=['GET'])
+@token_required
+def get_suggested_executors(current_user, listing_id):
+    limit = min(int(request.args.get('limit', 10)), 50)
+    
+    conn = get_db_connection()
+    try:
+        # Check if user owns the listing or belongs to its company
+        listing = conn.execute('''
+            SELECT l.* FROM listings l
+            WHERE l.id = ? AND (
+                l.user_id = ?
+                OR l.company_id IN (SELECT company_id FROM company_users WHERE user_id = ?)
+            )
+        ''', (listing_id, current_user['id'], current_user['id'])).fetchone()
+        
+        if not listing:
+            return jsonify({'error': 'Listing not found or unauthorized'}), 404
+        
+        # Executors who responded in the category before or subscribed to it,
+        # ranked by the precomputed reputation score
+        executors = conn.execute('''
+            SELECT u.id as user_id, u.email, u.phone, u.city, u.country,
+                   ep.experience_level, ep.points,
+                   es.score as executor_score, es.review_count, es.completed_jobs,
+                   CASE WHEN es.review_count > 0 THEN 1.0 * es.rating_sum / es.review_count END as average_rating
+            FROM executor_stats es
+            JOIN users u ON u.id = es.user_id
+            LEFT JOIN executor_profiles ep ON ep.user_id = es.user_id
+            WHERE es.user_id IN (
+                SELECT user_id FROM executor_category_affinity WHERE category = ?
+                UNION
+                SELECT user_id FROM subscriptions WHERE category = ?
+            )
+            AND es.user_id != ?
+            AND NOT EXISTS (
+                SELECT 1 FROM responses r WHERE r.listing_id = ? AND r.user_id = es.user_id
+            )
+            ORDER BY es.score DESC
+            LIMIT ?
+        ''', (
+            listing['category'],
+            normalize(listing['category']),
+            listing['user_id'],
+            listing_id,
+            limit
+        )).fetchall()
         
         return jsonify({
-            'responses': responses_list,
-            'count': len(responses_list)
+            'executors': [dict(executor) for executor in executors],
+            'count': len(executors)
         }), 200
         
     except Exception as e:
-        print(f"Error getting responses for listing {listing_id}:", str(e))
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
@@ -79,9 +185,11 @@ def get_my_responses(current_user):
     
     conn = get_db_connection()
     try:
+        columns = archive_columns('responses', 'r.')
+        
         # Build query based on filters
-        query = '''
-            SELECT r.*, l.title as listing_title, l.category, l.status as listing_status
+        query = f'''
+            SELECT {columns}, l.title as listing_title, l.category, l.status as listing_status, 0 as archived
             FROM responses r
             JOIN listings l ON r.listing_id = l.id
             WHERE r.user_id = ?
@@ -99,38 +207,37 @@ def get_my_responses(current_user):
             query += ' AND r.status = ?'
             params.append(status)
         
+        # Archived listings are completed, so only their accepted responses show
+        archive_query = f'''
+            SELECT {columns}, l.title as listing_title, l.category, l.status as listing_status, 1 as archived
+            FROM responses_archive r
+            JOIN listings_archive l ON r.listing_id = l.id
+            WHERE r.user_id = ? AND r.status = 'accepted'
+        '''
+        include_archive = status in (None, '', 'accepted')
+        
+        # Count total responses for pagination
+        count_query = f'SELECT COUNT(*) as count FROM ({query})'
+        count_params = list(params)
+        
+        if include_archive:
+            query += ' UNION ALL ' + archive_query
+            params.append(current_user['id'])
+            count_query += f' UNION ALL SELECT COUNT(*) as count FROM ({archive_query})'
+            count_params.append(current_user['id'])
+        
         # Add pagination
-        query += ' ORDER BY r.created_at DESC LIMIT ? OFFSET ?'
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?'
         params.extend([per_page, offset])
         
         # Execute query
         responses = conn.execute(query, params).fetchall()
         
-        # Count total responses for pagination
-        count_query = '''
-            SELECT COUNT(*) as count 
-            FROM responses r
-            JOIN listings l ON r.listing_id = l.id
-            WHERE r.user_id = ?
-            AND (
-                (l.status != 'completed' AND r.status IN ('pending', 'rejected'))
-                OR 
-                (l.status = 'completed' AND r.status = 'accepted')
-            )
-        '''
-        count_params = [current_user['id']]
-        
-        if status:
-            count_query += ' AND r.status = ?'
-            count_params.append(status)
-        
-        total = conn.execute(count_query, count_params).fetchone()['count']
-        
-        # Convert to list of dicts for JSON serialization
-        responses_list = [dict(response) for response in responses]
+        total = sum(row['count'] for row in conn.execute(count_query, count_params).fetchall())
         
-        return jsonify({
-            'responses': responses_list,
+        # Rows are serialized directly by the fast JSON encoder
+        return json_response({
+            'responses': responses,
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -142,6 +249,30 @@ def get_my_responses(current_user):
     finally:
         conn.close()
 
+# Get ids of responses inserted, updated or deleted since a sync token
+@responses_bp.route('/responses/changes', methods=['GET'])
+@token_required
+def get_response_changes(current_user):
+    conn = get_db_connection()
+    try:
+        since, limit = parse_changes_args(request.args)
+        
+        # Responses sent by the user and responses received on the user's listings
+        changes = get_changes(
+            conn, 'responses', since, limit,
+            'user_id = ? OR listing_owner_id = ?',
+            (current_user['id'], current_user['id'])
+        )
+        
+        return jsonify(changes), 200
+        
+    except InvalidSyncToken as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Get statistics for user's responses
 @responses_bp.route('/responses/my-responses/statistics', methods=['GET'])
 @token_required
@@ -154,9 +285,12 @@ def get_my_responses_statistics(current_user):
                 SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
                 SUM(CASE WHEN status = 'accepted' THEN 1 ELSE 0 END) as accepted,
                 SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END) as rejected
-            FROM responses
-            WHERE user_id = ?
-        ''', (current_user['id'],)).fetchone()
+            FROM (
+                SELECT status FROM responses WHERE user_id = ?
+                UNION ALL
+                SELECT status FROM responses_archive WHERE user_id = ?
+            )
+        ''', (current_user['id'], current_user['id'])).fetchone()
         return jsonify({
             'total': stats['total'],
             'pending': stats['pending'],
@@ -171,6 +305,8 @@ def get_my_responses_statistics(current_user):
 # Create response to listing
 @responses_bp.route('/listings/<int:listing_id>/responses', methods=['POST'])
 @token_required
+@idempotent
+@rate_limit('create_response', 60, 60, key='user')
 def create_response(current_user, listing_id):
     print(f"Creating response for listing {listing_id} by user {current_user['id']}")
     
@@ -179,8 +315,11 @@ def create_response(current_user, listing_id):
         print(f"User {current_user['id']} is not an executor")
         return jsonify({'error': 'Only executors can respond to listings'}), 403
     
-    conn = get_db_connection()
-    try:
+    data = request.get_json() or {}
+    print(f"Request data: {data}")
+    
+    # Runs on the writer thread, so the balance check and charge are one transaction
+    def write(conn):
         # Check if listing exists and is published
         listing = conn.execute('''
             SELECT * FROM listings 
@@ -189,7 +328,7 @@ def create_response(current_user, listing_id):
         
         if not listing:
             print(f"Listing {listing_id} not found or not published")
-            return jsonify({'error': 'Listing not found or not available'}), 404
+            return {'error': 'Listing not found or not available'}, 404, None
         
         # Check if user already responded to this listing
         existing_response = conn.execute('''
@@ -199,7 +338,7 @@ def create_response(current_user, listing_id):
         
         if existing_response:
             print(f"User {current_user['id']} already responded to listing {listing_id}")
-            return jsonify({'error': 'You have already responded to this listing'}), 409
+            return {'error': 'You have already responded to this listing'}, 409, None
         
         # Get user's company if exists
         company = conn.execute('''
@@ -219,7 +358,7 @@ def create_response(current_user, listing_id):
         
         if not user:
             print(f"User {current_user['id']} not found")
-            return jsonify({'error': 'User not found'}), 404
+            return {'error': 'User not found'}, 404, None
         
         print(f"Current user balance: {user['balance']}")
         
@@ -227,14 +366,11 @@ def create_response(current_user, listing_id):
         required_balance = 1  # Default cost for response
         if user['balance'] < required_balance:
             print(f"Insufficient balance: required {required_balance}, current {user['balance']}")
-            return jsonify({
+            return {
                 'error': 'Insufficient balance to respond',
                 'required': required_balance,
                 'current': user['balance']
-            }), 400
-        
-        data = request.get_json() or {}
-        print(f"Request data: {data}")
+            }, 400, None
         
         # Insert response
         cursor = conn.execute('''
@@ -271,21 +407,30 @@ def create_response(current_user, listing_id):
             f"Responded to listing: {listing['title']}"
         ))
         
-        conn.commit()
-        print("Transaction committed successfully")
-        
-        return jsonify({
+        return {
             'message': 'Response created successfully',
             'response_id': response_id,
             'remaining_balance': new_balance
-        }), 201
+        }, 201, listing['user_id']
+    
+    try:
+        result, status, listing_owner_id = write_queue.submit(write)
+        
+        if status == 201:
+            print("Transaction committed successfully")
+            publish_event('response_created', {
+                'response_id': result['response_id'],
+                'listing_id': listing_id,
+                'status': 'pending'
+            }, [listing_owner_id, current_user['id']])
+        
+        return jsonify(result), status
         
+    except WriteUnavailable as e:
+        return write_unavailable_response(e)
     except Exception as e:
         print(f"Error creating response: {str(e)}")
-        conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 # Update response status (accept/reject)
 @responses_bp.route('/responses/<int:response_id>/status', methods=['PUT'])
@@ -335,6 +480,12 @@ def update_response_status(current_user, response_id):
         
         conn.commit()
         
+        publish_event('response_status_changed', {
+            'response_id': response_id,
+            'listing_id': listing['id'],
+            'status': data['status']
+        }, [response['user_id'], current_user['id']])
+        
         return jsonify({'message': f'Response {data["status"]} successfully'}), 200
         
     except Exception as e:
@@ -343,6 +494,105 @@ def update_response_status(current_user, response_id):
     finally:
         conn.close()
 
+# Batch update response statuses for one listing (accept/reject many at once)
+@responses_bp.route('/listings/<int:listing_id>/responses/status', methods=['PUT'])
+@token_required
+def batch_update_response_status(current_user, listing_id):
+    data = request.get_json() or {}
+    updates = data.get('updates', [])
+    reject_others = bool(data.get('reject_others', False))
+    
+    if not isinstance(updates, list) or (not updates and not reject_others):
+        return jsonify({'error': 'Missing updates'}), 400
+    
+    valid_statuses = ['accepted', 'rejected']
+    
+    conn = get_db_connection()
+    try:
+        # Check if user owns the listing (once for the whole batch)
+        listing = conn.execute('''
+            SELECT * FROM listings 
+            WHERE id = ? AND user_id = ?
+        ''', (listing_id, current_user['id'])).fetchone()
+        
+        if not listing:
+            return jsonify({'error': 'Listing not found or unauthorized'}), 404
+        
+        # Current statuses and executors of all responses on the listing
+        current_statuses = {}
+        executors = {}
+        for row in conn.execute('SELECT id, user_id, status FROM responses WHERE listing_id = ?', (listing_id,)):
+            current_statuses[row['id']] = row['status']
+            executors[row['id']] = row['user_id']
+        
+        results = []
+        changes = {}
+        requested_ids = set()
+        for update in updates:
+            response_id = update.get('response_id') if isinstance(update, dict) else None
+            status = update.get('status') if isinstance(update, dict) else None
+            
+            # Ids must be integers (bool is an int subclass, but not an id)
+            if not isinstance(response_id, int) or isinstance(response_id, bool):
+                results.append({'response_id': response_id, 'status': status, 'result': 'invalid_id'})
+                continue
+            requested_ids.add(response_id)
+            
+            if response_id not in current_statuses:
+                results.append({'response_id': response_id, 'status': status, 'result': 'not_found'})
+            elif status not in valid_statuses:
+                results.append({'response_id': response_id, 'status': status, 'result': 'invalid_status'})
+            elif response_id in changes:
+                results.append({'response_id': response_id, 'status': status, 'result': 'duplicate'})
+            else:
+                changes[response_id] = status
+                results.append({'response_id': response_id, 'status': status, 'result': 'updated'})
+        
+        # Reject every pending response that was not explicitly listed
+        if reject_others:
+            for response_id, status in current_statuses.items():
+                if status == 'pending' and response_id not in requested_ids:
+                    changes[response_id] = 'rejected'
+                    results.append({'response_id': response_id, 'status': 'rejected', 'result': 'updated'})
+        
+        if changes:
+            conn.executemany(
+                'UPDATE responses SET status = ? WHERE id = ?',
+                [(status, response_id) for response_id, status in changes.items()]
+            )
+            
+            # Log activity
+            conn.executemany('''
+                INSERT INTO activity_log (user_id, company_id, action_type, description)
+                VALUES (?, ?, ?, ?)
+            ''', [(
+                current_user['id'],
+                listing['company_id'],
+                'update_response_status',
+                f"Updated response status to {status} for listing: {listing['title']}"
+            ) for status in changes.values()])
+            
+            conn.commit()
+            
+            for response_id, status in changes.items():
+                publish_event('response_status_changed', {
+                    'response_id': response_id,
+                    'listing_id': listing_id,
+                    'status': status
+                }, [executors[response_id], current_user['id']])
+        
+        return jsonify({
+            'message': f'{len(changes)} responses updated',
+            'updated': len(changes),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Delete response
 @responses_bp.route('/responses/<int:response_id>', methods=['DELETE'])
 @token_required
@@ -381,6 +631,11 @@ def delete_response(current_user, response_id):
         
         conn.commit()
         
+        publish_event('response_deleted', {
+            'response_id': response_id,
+            'listing_id': response['listing_id']
+        }, [listing['user_id'] if listing else None, current_user['id']])
+        
         return jsonify({'message': 'Response deleted successfully'}), 200
         
     except Exception as e:
@@ -394,24 +649,36 @@ def delete_response(current_user, response_id):
 def get_user_reviews(user_id):
     conn = get_db_connection()
     try:
-        reviews = conn.execute('''
-            SELECT r.*, u.email as customer_email, l.title as listing_title
+        # Answer conditional requests before running the reviews query
+        validators = get_validators(conn, ['reviews', 'users', 'listings'], user_id)
+        if is_not_modified(validators):
+            return not_modified_response(validators)
+        
+        # Reviews of archived listings are read through from the archive
+        columns = archive_columns('reviews', 'r.')
+        reviews = conn.execute(f'''
+            SELECT {columns}, u.email as customer_email, l.title as listing_title
             FROM reviews r
             JOIN users u ON r.customer_id = u.id
             JOIN listings l ON r.listing_id = l.id
             WHERE r.executor_id = ?
-            ORDER BY r.created_at DESC
-        ''', (user_id,)).fetchall()
-        reviews_list = [dict(row) for row in reviews]
+            UNION ALL
+            SELECT {columns}, u.email as customer_email, l.title as listing_title
+            FROM reviews_archive r
+            JOIN users u ON r.customer_id = u.id
+            JOIN listings_archive l ON r.listing_id = l.id
+            WHERE r.executor_id = ?
+            ORDER BY created_at DESC, id DESC
+        ''', (user_id, user_id)).fetchall()
         avg_rating = None
-        count = len(reviews_list)
+        count = len(reviews)
         if count > 0:
-            avg_rating = sum([r['rating'] for r in reviews_list]) / count
-        return jsonify({
-            'reviews': reviews_list,
+            avg_rating = sum([r['rating'] for r in reviews]) / count
+        return add_validators(json_response({
+            'reviews': reviews,
             'average_rating': avg_rating,
             'count': count
-        }), 200
+        }), validators), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -3,70 +3,121 @@ User management routes for the Metal-Rezerv API.
 Handles user profile operations, settings, and user-specific data.
 """
 
-import sqlite3
 import os
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash
 from src.utils.auth_middleware import token_required
+from src.utils.subscription_index import subscription_index, normalize
+from src.utils.db import connect
+from src.utils.deletion_worker import deletion_worker, enqueue_deletion
+from src.repositories.users import user_repository
+from src.repositories.companies import company_repository
 
 users_bp = Blueprint('users', __name__)
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
 
+# Dashboard identity: user, company, executor profile and reputation in one row.
+# Columns of joined tables carry a "<section>__" prefix.
+DASHBOARD_IDENTITY_SQL = '''
+    SELECT
+        u.id, u.email, u.role, u.phone, u.city, u.country, u.created_at, u.balance,
+        c.id as company__id, c.name as company__name, c.bin as company__bin,
+        c.address as company__address, c.status as company__status,
+        c.balance as company__balance, c.max_balance as company__max_balance,
+        c.created_at as company__created_at, cu.role as company__member_role,
+        ep.experience_level as executor__experience_level, ep.points as executor__points,
+        ep.spent_points as executor__spent_points, es.score as executor__score,
+        es.review_count as executor__review_count, es.completed_jobs as executor__completed_jobs,
+        CASE WHEN es.review_count > 0 THEN 1.0 * es.rating_sum / es.review_count END as executor__average_rating,
+        (SELECT COUNT(*) FROM notifications n WHERE n.user_id = u.id AND n.is_read = 0) as unread_notifications
+    FROM users u
+    LEFT JOIN company_users cu ON cu.user_id = u.id
+    LEFT JOIN companies c ON c.id = cu.company_id
+    LEFT JOIN executor_profiles ep ON ep.user_id = u.id
+    LEFT JOIN executor_stats es ON es.user_id = u.id
+    WHERE u.id = :id
+    LIMIT 1
+'''
+
+# Dashboard statistics per role, same values as the my-listings and
+# my-responses statistics endpoints (archived rows included)
+DASHBOARD_STATISTICS_SQL = {
+    'customer': '''
+        SELECT
+            COUNT(*) + (SELECT COUNT(*) FROM listings_archive WHERE user_id = :id) as totalListings,
+            COALESCE(SUM(status = 'published'), 0) as activeListings,
+            COALESCE(SUM(status = 'completed'), 0)
+                + (SELECT COUNT(*) FROM listings_archive WHERE user_id = :id) as completedListings,
+            (SELECT COUNT(*) FROM responses
+             WHERE listing_id IN (SELECT id FROM listings WHERE user_id = :id))
+                + (SELECT COUNT(*) FROM responses_archive
+                   WHERE listing_id IN (SELECT id FROM listings_archive WHERE user_id = :id)) as totalResponses
+        FROM listings
+        WHERE user_id = :id
+    ''',
+    'executor': '''
+        SELECT
+            COUNT(*) as total,
+            COALESCE(SUM(status = 'pending'), 0) as pending,
+            COALESCE(SUM(status = 'accepted'), 0) as accepted,
+            COALESCE(SUM(status = 'rejected'), 0) as rejected
+        FROM (
+            SELECT status FROM responses WHERE user_id = :id
+            UNION ALL
+            SELECT status FROM responses_archive WHERE user_id = :id
+        )
+    '''
+}
+
+# Helper function to split the "<section>__" prefixed columns of a row.
+# Returns None for sections whose columns are all NULL (missing joins).
+def split_sections(row):
+    result = {}
+    sections = {}
+    for key in row.keys():
+        if '__' in key:
+            section, column = key.split('__', 1)
+            sections.setdefault(section, {})[column] = row[key]
+        else:
+            result[key] = row[key]
+    
+    for section, values in sections.items():
+        result[section] = values if any(value is not None for value in values.values()) else None
+    return result
+
 # Helper function to get database connection
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect(DB_PATH)
 
 # Get user profile
 @users_bp.route('/profile', methods=['GET'])
 @token_required
 def get_profile(current_user):
-    conn = get_db_connection()
     try:
         # Get user data
-        user = conn.execute('SELECT id, email, role, phone, city, country, created_at, balance FROM users WHERE id = ?', 
-                           (current_user['id'],)).fetchone()
+        user = user_repository.get(current_user['id'])
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         # Get company data if exists
-        company = conn.execute('''
-            SELECT c.* FROM companies c
-            JOIN company_users cu ON c.id = cu.company_id
-            WHERE cu.user_id = ?
-        ''', (current_user['id'],)).fetchone()
+        company = company_repository.get_for_user(current_user['id'])
         
         # Get executor profile if user is executor
         executor_profile = None
         if user['role'] == 'executor':
-            executor_profile = conn.execute(
-                'SELECT * FROM executor_profiles WHERE user_id = ?',
-                (current_user['id'],)
-            ).fetchone()
-        
-        # Convert to dict for JSON serialization
-        user_dict = dict(user)
-        company_dict = dict(company) if company else None
-        executor_dict = dict(executor_profile) if executor_profile else None
-        
-        # Remove password from user dict
-        if 'password' in user_dict:
-            del user_dict['password']
+            executor_profile = user_repository.get_executor_profile(current_user['id'])
         
         return jsonify({
-            'user': user_dict,
-            'company': company_dict,
-            'executor_profile': executor_dict
+            'user': user,
+            'company': company,
+            'executor_profile': executor_profile
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 # Update user profile
 @users_bp.route('/profile', methods=['PUT'])
@@ -141,11 +192,25 @@ def change_password(current_user):
 def delete_account(current_user):
     conn = get_db_connection()
     try:
-        # Delete user (cascade will delete related records)
-        conn.execute('DELETE FROM users WHERE id = ?', (current_user['id'],))
+        # Tombstone the account so it can no longer log in or be found
+        conn.execute('''
+            UPDATE users
+            SET email = ?, password = '', phone = NULL
+            WHERE id = ?
+        ''', (f"deleted-{current_user['id']}@deleted.invalid", current_user['id']))
+        
+        # Hide the user's listings right away
+        conn.execute('''
+            UPDATE listings SET status = 'unpublished'
+            WHERE user_id = ? AND status = 'published'
+        ''', (current_user['id'],))
+        
+        # Dependent rows are purged in the background
+        job_id = enqueue_deletion(conn, 'user', current_user['id'])
         conn.commit()
+        deletion_worker.wake()
         
-        return jsonify({'message': 'Account deleted successfully'}), 200
+        return jsonify({'message': 'Account deleted successfully', 'deletion_job_id': job_id}), 202
         
     except Exception as e:
         conn.rollback()
@@ -199,3 +264,226 @@ def get_balance(current_user):
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
+
+# Get everything the dashboard of the user's role shows, in one round trip
+@users_bp.route('/dashboard', methods=['GET'])
+@token_required
+def get_dashboard(current_user):
+    conn = get_db_connection()
+    try:
+        identity = conn.execute(DASHBOARD_IDENTITY_SQL, {'id': current_user['id']}).fetchone()
+        
+        if not identity:
+            return jsonify({'error': 'User not found'}), 404
+        
+        dashboard = split_sections(identity)
+        unread_notifications = dashboard.pop('unread_notifications')
+        company = dashboard.pop('company')
+        executor = dashboard.pop('executor')
+        
+        statistics = None
+        statistics_sql = DASHBOARD_STATISTICS_SQL.get(identity['role'])
+        if statistics_sql:
+            statistics = dict(conn.execute(statistics_sql, {'id': current_user['id']}).fetchone())
+        
+        return jsonify({
+            'user': dashboard,
+            'company': company,
+            'executor_profile': executor if identity['role'] == 'executor' else None,
+            'balance': identity['balance'] or 0,
+            'statistics': statistics,
+            'unread_notifications': unread_notifications
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get executor's subscriptions
+@users_bp.route('/subscriptions', methods=['GET'])
+@token_required
+def get_subscriptions(current_user):
+    conn = get_db_connection()
+    try:
+        subscriptions = conn.execute('''
+            SELECT * FROM subscriptions 
+            WHERE user_id = ? 
+            ORDER BY category, country, city
+        ''', (current_user['id'],)).fetchall()
+        
+        return jsonify({'subscriptions': [dict(subscription) for subscription in subscriptions]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Subscribe executor to new listings of a category (optionally in a city/country)
+@users_bp.route('/subscriptions', methods=['POST'])
+@token_required
+def create_subscription(current_user):
+    if current_user['role'] != 'executor':
+        return jsonify({'error': 'Only executors can subscribe to listings'}), 403
+    
+    data = request.get_json() or {}
+    
+    category = normalize(data.get('category'))
+    if not category:
+        return jsonify({'error': 'Missing required field: category'}), 400
+    
+    city = normalize(data.get('city'))
+    country = normalize(data.get('country'))
+    
+    conn = get_db_connection()
+    try:
+        existing = conn.execute('''
+            SELECT id FROM subscriptions 
+            WHERE user_id = ? AND category = ? AND city = ? AND country = ?
+        ''', (current_user['id'], category, city, country)).fetchone()
+        
+        if existing:
+            return jsonify({'error': 'Already subscribed', 'subscription_id': existing['id']}), 409
+        
+        cursor = conn.execute('''
+            INSERT INTO subscriptions (user_id, category, city, country) 
+            VALUES (?, ?, ?, ?)
+        ''', (current_user['id'], category, city, country))
+        conn.commit()
+        
+        subscription_index.apply(conn, added=[(current_user['id'], category, city, country)])
+        
+        return jsonify({
+            'message': 'Subscribed successfully',
+            'subscription_id': cursor.lastrowid
+        }), 201
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Delete executor's subscription
+@users_bp.route('/subscriptions/<int:subscription_id>', methods=['DELETE'])
+@token_required
+def delete_subscription(current_user, subscription_id):
+    conn = get_db_connection()
+    try:
+        subscription = conn.execute('''
+            SELECT * FROM subscriptions 
+            WHERE id = ? AND user_id = ?
+        ''', (subscription_id, current_user['id'])).fetchone()
+        
+        if not subscription:
+            return jsonify({'error': 'Subscription not found'}), 404
+        
+        conn.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,))
+        conn.commit()
+        
+        subscription_index.apply(conn, removed=[(
+            subscription['user_id'], subscription['category'], subscription['city'], subscription['country']
+        )])
+        
+        return jsonify({'message': 'Unsubscribed successfully'}), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get user notifications
+@users_bp.route('/notifications', methods=['GET'])
+@token_required
+def get_notifications(current_user):
+    # Parse query parameters
+    unread_only = request.args.get('unread', '').lower() in ('1', 'true', 'yes')
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', 20))
+    
+    # Calculate offset
+    offset = (page - 1) * per_page
+    
+    conn = get_db_connection()
+    try:
+        query = 'SELECT * FROM notifications WHERE user_id = ?'
+        params = [current_user['id']]
+        
+        if unread_only:
+            query += ' AND is_read = 0'
+        
+        query += ' ORDER BY id DESC LIMIT ? OFFSET ?'
+        params.extend([per_page, offset])
+        
+        notifications = conn.execute(query, params).fetchall()
+        
+        unread_count = conn.execute('''
+            SELECT COUNT(*) as count FROM notifications 
+            WHERE user_id = ? AND is_read = 0
+        ''', (current_user['id'],)).fetchone()['count']
+        
+        return jsonify({
+            'notifications': [dict(notification) for notification in notifications],
+            'unread_count': unread_count,
+            'page': page,
+            'per_page': per_page
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Get number of unread notifications
+@users_bp.route('/notifications/unread-count', methods=['GET'])
+@token_required
+def get_unread_notifications_count(current_user):
+    conn = get_db_connection()
+    try:
+        unread_count = conn.execute('''
+            SELECT COUNT(*) as count FROM notifications 
+            WHERE user_id = ? AND is_read = 0
+        ''', (current_user['id'],)).fetchone()['count']
+        
+        return jsonify({'unread_count': unread_count}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Mark notifications as read (the given ids, or all of them)
+@users_bp.route('/notifications/read', methods=['PUT'])
+@token_required
+def mark_notifications_read(current_user):
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': 'Invalid ids'}), 400
+    
+    conn = get_db_connection()
+    try:
+        if ids is None:
+            cursor = conn.execute('''
+                UPDATE notifications SET is_read = 1 
+                WHERE user_id = ? AND is_read = 0
+            ''', (current_user['id'],))
+            updated = cursor.rowcount
+        else:
+            cursor = conn.executemany('''
+                UPDATE notifications SET is_read = 1 
+                WHERE id = ? AND user_id = ? AND is_read = 0
+            ''', [(notification_id, current_user['id']) for notification_id in ids])
+            updated = cursor.rowcount
+        
+        conn.commit()
+        
+        return jsonify({'message': 'Notifications marked as read', 'updated': updated}), 200
+        
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
@@ -0,0 +1,75 @@
+"""
+Archive tier for the Metal-Rezerv API.
+Moves completed listings that have not changed for a while, together with
+their responses and reviews, from the hot tables into the *_archive tables.
+History endpoints read both tiers, so archiving is invisible to owners.
+"""
+
+# Columns shared by each hot table and its archive table
+ARCHIVE_COLUMNS = {
+    'listings': [
+        'id', 'title', 'description', 'description_preview', 'category', 'purchase_method', 'payment_terms',
+        'listing_type', 'delivery_date', 'purchase_date', 'publication_period', 'status',
+        'user_id', 'company_id', 'city', 'country', 'created_at', 'updated_at'
+    ],
+    'responses': ['id', 'listing_id', 'user_id', 'company_id', 'status', 'message', 'created_at', 'updated_at'],
+    'reviews': ['id', 'listing_id', 'customer_id', 'executor_id', 'rating', 'text', 'created_at']
+}
+
+# Default age of completed listings to archive, and listings moved per transaction
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 200
+
+# Helper function to get the comma separated columns of a table.
+# Prefixed columns are aliased, so ORDER BY of a UNION can refer to them.
+def archive_columns(table, prefix=''):
+    if not prefix:
+        return ', '.join(ARCHIVE_COLUMNS[table])
+    return ', '.join(f'{prefix}{column} as {column}' for column in ARCHIVE_COLUMNS[table])
+
+# Move completed listings older than the given number of days into the archive.
+# Every batch is its own transaction, so writers are only blocked briefly.
+# Returns the number of archived rows per table.
+def archive_completed_listings(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    archived = {'listings': 0, 'responses': 0, 'reviews': 0}
+
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [row['id'] for row in conn.execute('''
+                SELECT id FROM listings
+                WHERE status = 'completed' AND updated_at <= datetime('now', ?)
+                ORDER BY id
+                LIMIT ?
+            ''', (f'-{int(older_than_days)} days', batch_size)).fetchall()]
+
+            if not ids:
+                conn.rollback()
+                break
+
+            placeholders = ', '.join(['?'] * len(ids))
+
+            # Copy first, so the reviews delete trigger sees the archived copy
+            # and keeps the executor stats unchanged
+            for table, column in (('reviews', 'listing_id'), ('responses', 'listing_id'), ('listings', 'id')):
+                columns = archive_columns(table)
+                cursor = conn.execute(f'''
+                    INSERT OR REPLACE INTO {table}_archive ({columns})
+                    SELECT {columns} FROM {table} WHERE {column} IN ({placeholders})
+                ''', ids)
+                archived[table] += cursor.rowcount
+
+            # Delete children before their listings
+            for table, column in (('reviews', 'listing_id'), ('responses', 'listing_id'),
+                                  ('notifications', 'listing_id'), ('listings', 'id')):
+                conn.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids)
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if len(ids) < batch_size:
+            break
+
+    return archived
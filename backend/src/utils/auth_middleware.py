@@ -5,7 +5,20 @@ Provides token validation and user role verification.
 
 import jwt
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
+
+# Decode and verify a token, reusing the result within the app context.
+# Batch sub-requests share the app context of their batch request, so the
+# token is verified once per batch.
+def decode_token(token):
+    payloads = g.setdefault('token_payloads', {})
+    if token not in payloads:
+        payloads[token] = jwt.decode(
+            token,
+            current_app.config.get('SECRET_KEY'),
+            algorithms=['HS256']
+        )
+    return payloads[token]
 
 def token_required(f):
     @wraps(f)
@@ -19,11 +32,7 @@ def token_required(f):
         
         try:
             # Decode token
-            payload = jwt.decode(
-                token,
-                current_app.config.get('SECRET_KEY'),
-                algorithms=['HS256']
-            )
+            payload = decode_token(token)
             
             # Create current_user object
             current_user = {
@@ -52,11 +61,7 @@ def admin_required(f):
         
         try:
             # Decode token
-            payload = jwt.decode(
-                token,
-                current_app.config.get('SECRET_KEY'),
-                algorithms=['HS256']
-            )
+            payload = decode_token(token)
             
             # Check if user is admin
             if payload['role'] != 'admin':
@@ -76,3 +81,37 @@ def admin_required(f):
             return jsonify({'error': 'Invalid token'}), 401
     
     return decorated
+
+# Like token_required, but also accepts the token as a ?token= query
+# parameter, because browser EventSource cannot send headers
+def stream_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        
+        if auth_header and auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+        else:
+            token = request.args.get('token')
+        
+        if not token:
+            return jsonify({'error': 'Missing or invalid token'}), 401
+        
+        try:
+            # Decode token
+            payload = decode_token(token)
+            
+            # Create current_user object
+            current_user = {
+                'id': payload['sub'],
+                'role': payload['role']
+            }
+            
+            return f(current_user, *args, **kwargs)
+            
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token expired'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+    
+    return decorated
@@ -0,0 +1,130 @@
+"""
+Delta-sync change feeds for the Metal-Rezerv API.
+Reads the change_log sequence written by triggers and reports which rows
+were inserted, updated or deleted since a client's last sync token.
+
+Entries older than CHANGE_LOG_RETENTION_DAYS are pruned by the deletion
+worker; tokens from before the oldest kept entry get 410 and reload the
+full list.
+"""
+
+import time
+
+# Default and maximum number of change_log entries read per request
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+# Days change_log entries are kept, and entries deleted per transaction
+CHANGE_LOG_RETENTION_DAYS = 30
+CHANGE_LOG_PRUNE_BATCH = 1000
+CHANGE_LOG_PRUNE_PAUSE = 0.05  # seconds between batches, lets other writers in
+
+class InvalidSyncToken(Exception):
+    """Raised when a sync token is malformed or no longer usable."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Helper function to parse the since/limit query parameters
+def parse_changes_args(args):
+    since = args.get('since', '0')
+    try:
+        since = int(since)
+    except ValueError:
+        raise InvalidSyncToken('Invalid sync token')
+    if since < 0:
+        raise InvalidSyncToken('Invalid sync token')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_CHANGES_LIMIT))
+    except ValueError:
+        limit = DEFAULT_CHANGES_LIMIT
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+
+    return since, limit
+
+# Delete change_log entries older than the given number of days in batches,
+# committing after each one. The newest entry is always kept, so MAX(seq)
+# still validates the tokens of clients that are up to date.
+# Returns the number of deleted entries.
+def prune_change_log(conn, older_than_days=CHANGE_LOG_RETENTION_DAYS, batch_size=CHANGE_LOG_PRUNE_BATCH):
+    # seq grows with changed_at, so everything below the first recent entry is old.
+    # Earlier prunes keep that prefix short.
+    cutoff = conn.execute('''
+        SELECT COALESCE(
+            (SELECT seq FROM change_log WHERE changed_at >= datetime('now', ?) ORDER BY seq LIMIT 1),
+            (SELECT MAX(seq) FROM change_log)
+        ) as seq
+    ''', (f'-{int(older_than_days)} days',)).fetchone()['seq']
+    if cutoff is None:
+        return 0
+
+    pruned = 0
+    while True:
+        cursor = conn.execute('''
+            DELETE FROM change_log
+            WHERE seq IN (SELECT seq FROM change_log WHERE seq < ? ORDER BY seq LIMIT ?)
+        ''', (cutoff, batch_size))
+        conn.commit()
+        pruned += cursor.rowcount
+
+        if cursor.rowcount < batch_size:
+            return pruned
+        time.sleep(CHANGE_LOG_PRUNE_PAUSE)
+
+# Get the changes of a table after the since token.
+# where/params narrow the change_log rows visible to the caller.
+def get_changes(conn, table, since, limit, where=None, params=()):
+    bounds = conn.execute('SELECT MIN(seq) as min_seq, MAX(seq) as max_seq FROM change_log').fetchone()
+    min_seq = bounds['min_seq'] or 0
+    max_seq = bounds['max_seq'] or 0
+
+    # Tokens from a reset database or from before pruned entries need a full resync
+    if since > max_seq or (since and min_seq and since < min_seq - 1):
+        raise InvalidSyncToken('Sync token expired, reload the full list', 410)
+
+    query = '''
+        SELECT seq, row_id, operation
+        FROM change_log
+        WHERE table_name = ? AND seq > ?
+    '''
+    query_params = [table, since]
+    if where:
+        query += f' AND ({where})'
+        query_params.extend(params)
+    query += ' ORDER BY seq LIMIT ?'
+    query_params.append(limit)
+
+    rows = conn.execute(query, query_params).fetchall()
+
+    # Collapse the operations of every row into its net change
+    first_operations = {}
+    last_operations = {}
+    for row in rows:
+        first_operations.setdefault(row['row_id'], row['operation'])
+        last_operations[row['row_id']] = row['operation']
+
+    inserted, updated, deleted = [], [], []
+    for row_id, last_operation in last_operations.items():
+        first_operation = first_operations[row_id]
+        if last_operation == 'delete':
+            # Rows created and deleted within the window never reached the client
+            if first_operation != 'insert':
+                deleted.append(row_id)
+        elif first_operation == 'insert':
+            inserted.append(row_id)
+        else:
+            updated.append(row_id)
+
+    has_more = len(rows) == limit
+    # Without more rows the client may skip ahead to the newest sequence
+    next_token = rows[-1]['seq'] if has_more else max([since, max_seq] + [row['seq'] for row in rows[-1:]])
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': deleted,
+        'next': str(next_token),
+        'has_more': has_more
+    }
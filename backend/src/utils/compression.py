@@ -0,0 +1,114 @@
+"""
+Response compression for the Metal-Rezerv API.
+Compresses JSON and text responses above a size threshold with the best
+encoding the client accepts: brotli or zstd when the optional brotli /
+zstandard packages are installed, gzip otherwise.
+
+Responses carrying an ETag have a body fully determined by that ETag, so
+their compressed bytes are kept in a small LRU cache and hot pages are only
+compressed once. Streamed responses (exports, event streams) are left alone.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/csv'}
+
+# Compressed bodies kept for responses with an ETag
+COMPRESSION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+COMPRESSION_CACHE_MAX_ENTRY = 1024 * 1024
+
+# Encoders in order of preference
+ENCODERS = OrderedDict()
+if brotli is not None:
+    ENCODERS['br'] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    ENCODERS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+ENCODERS['gzip'] = lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+
+class CompressionCache:
+    """LRU cache of compressed bodies keyed by (path, ETag, encoding), bounded in bytes."""
+
+    def __init__(self, max_bytes=COMPRESSION_CACHE_MAX_BYTES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._max_bytes = max_bytes
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > COMPRESSION_CACHE_MAX_ENTRY:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+# Cache shared by all requests of the process
+compression_cache = CompressionCache()
+
+# Helper function to pick the preferred encoding accepted by the client (None if none)
+def choose_encoding(accept_encodings):
+    for encoding in ENCODERS:
+        if accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+# after_request hook compressing eligible responses
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    # The body depends on Accept-Encoding from here on, even when not compressed
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.content_length is not None and response.content_length < COMPRESSION_MIN_SIZE):
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    etag = response.headers.get('ETag')
+    key = (request.path, etag, encoding)
+    compressed = compression_cache.get(key) if etag else None
+    if compressed is None:
+        compressed = ENCODERS[encoding](data)
+        if etag:
+            compression_cache.put(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,154 @@
+"""
+SQLite connection helper for the Metal-Rezerv API.
+Every connection enforces foreign keys, so the ON DELETE CASCADE and
+SET NULL clauses of the schema actually apply.
+
+Connections come in two lanes. GET requests get read-only connections
+(mode=ro, query_only, larger page cache and mmap); everything else gets
+writer connections that take the write lock up front with BEGIN IMMEDIATE
+and wait up to BUSY_TIMEOUT for it. With the database in WAL mode, long
+reads no longer hold back writer commits. Both lanes are counted in
+lane_metrics.
+
+A request may open a shared connection (see open_shared_connection); every
+connect() to the same database within its app context then reuses it, which
+lets the sub-requests of a batch share one connection.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+from flask import g, has_app_context, has_request_context, request
+
+# Seconds a connection waits for a lock held by another connection
+BUSY_TIMEOUT = 10
+
+# Read lane settings: page cache in KiB and memory-mapped I/O in bytes
+READ_CACHE_SIZE_KB = 16384
+READ_MMAP_SIZE = 256 * 1024 * 1024
+
+# Request methods served by the read lane
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+class LaneMetrics:
+    """Thread-safe counters of the connections and commits of each lane."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lanes = {lane: self._empty() for lane in ('read', 'write')}
+
+    @staticmethod
+    def _empty():
+        return {
+            'opened': 0, 'open': 0, 'held_seconds': 0.0, 'max_held_seconds': 0.0,
+            'commits': 0, 'commit_seconds': 0.0, 'max_commit_seconds': 0.0
+        }
+
+    def opened(self, lane):
+        with self._lock:
+            self._lanes[lane]['opened'] += 1
+            self._lanes[lane]['open'] += 1
+
+    def closed(self, lane, seconds):
+        with self._lock:
+            metrics = self._lanes[lane]
+            metrics['open'] -= 1
+            metrics['held_seconds'] += seconds
+            metrics['max_held_seconds'] = max(metrics['max_held_seconds'], seconds)
+
+    def committed(self, lane, seconds):
+        with self._lock:
+            metrics = self._lanes[lane]
+            metrics['commits'] += 1
+            metrics['commit_seconds'] += seconds
+            metrics['max_commit_seconds'] = max(metrics['max_commit_seconds'], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {lane: dict(metrics) for lane, metrics in self._lanes.items()}
+
+# Metrics shared by all connections of the process
+lane_metrics = LaneMetrics()
+
+class LaneConnection(sqlite3.Connection):
+    """Connection that reports its lifetime and commits to lane_metrics."""
+
+    lane = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._opened_at = time.monotonic()
+        self._closed = False
+        lane_metrics.opened(self.lane)
+
+    def commit(self):
+        started = time.monotonic()
+        super().commit()
+        lane_metrics.committed(self.lane, time.monotonic() - started)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            lane_metrics.closed(self.lane, time.monotonic() - self._opened_at)
+        super().close()
+
+class ReadConnection(LaneConnection):
+    lane = 'read'
+
+class WriteConnection(LaneConnection):
+    lane = 'write'
+
+class SharedConnection(ReadConnection):
+    """Read connection reused by several handlers; close() is a no-op until release()."""
+
+    def close(self):
+        pass
+
+    def release(self):
+        super().close()
+
+# Open a read-only connection of the read lane
+def connect_readonly(db_path, factory=ReadConnection):
+    uri = f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, factory=factory)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = ON')
+    conn.execute(f'PRAGMA cache_size = -{READ_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {READ_MMAP_SIZE}')
+    return conn
+
+# Open a connection of the writer lane. Transactions start with
+# BEGIN IMMEDIATE, so writers queue on the busy timeout instead of failing
+# when a deferred transaction tries to upgrade its lock.
+def connect_writer(db_path, timeout=BUSY_TIMEOUT):
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level='IMMEDIATE', factory=WriteConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+# Open a connection with Row results and foreign key enforcement.
+# The pragma is per connection and must be set outside a transaction.
+# Without an explicit readonly flag, GET requests use the read lane.
+def connect(db_path, readonly=None):
+    if has_app_context():
+        shared = g.get('shared_connection')
+        if shared is not None and shared.db_path == db_path:
+            return shared
+
+    if readonly is None:
+        readonly = has_request_context() and request.method in READ_METHODS
+
+    if readonly:
+        return connect_readonly(db_path)
+    return connect_writer(db_path)
+
+# Open a read connection shared by every connect() to db_path in the current
+# app context. The caller must release() it and clear g.shared_connection.
+def open_shared_connection(db_path):
+    conn = connect_readonly(db_path, factory=SharedConnection)
+    conn.db_path = db_path
+    g.shared_connection = conn
+    return conn
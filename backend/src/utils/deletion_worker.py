@@ -0,0 +1,182 @@
+"""
+Background deletion worker for the Metal-Rezerv API.
+Deleting an account only tombstones the user and queues a job in
+deletion_jobs; this worker then purges the dependent rows in small
+batches, committing after each one so other writers are never blocked for
+long. Jobs are idempotent, so a job interrupted by a restart is simply run
+again. Between jobs the worker also prunes old change_log entries every
+CHANGE_LOG_PRUNE_INTERVAL.
+"""
+
+import os
+import logging
+import threading
+import time
+from src.utils.changes import prune_change_log
+from src.utils.db import connect
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
+
+# Worker settings
+DELETION_BATCH_SIZE = 500
+DELETION_BATCH_PAUSE = 0.05  # seconds between batches, lets other writers in
+DELETION_POLL_INTERVAL = 60  # seconds between checks for jobs of other processes
+CHANGE_LOG_PRUNE_INTERVAL = 3600  # seconds between change_log prunes
+
+USER_LISTINGS = 'SELECT id FROM listings WHERE user_id = :id'
+USER_ARCHIVED_LISTINGS = 'SELECT id FROM listings_archive WHERE user_id = :id'
+
+# Deletion plans: ordered (table, condition, key column) steps run before the
+# entity row itself is deleted. Children go first, so deleting a parent row
+# never cascades into a large number of rows.
+DELETION_PLANS = {
+    'user': {
+        'steps': [
+            ('reviews_archive', f'customer_id = :id OR executor_id = :id OR listing_id IN ({USER_ARCHIVED_LISTINGS})', 'id'),
+            ('responses_archive', f'user_id = :id OR listing_id IN ({USER_ARCHIVED_LISTINGS})', 'id'),
+            ('listings_archive', 'user_id = :id', 'id'),
+            ('notifications', f'user_id = :id OR listing_id IN ({USER_LISTINGS})', 'id'),
+            ('reviews', f'customer_id = :id OR executor_id = :id OR listing_id IN ({USER_LISTINGS})', 'id'),
+            ('responses', f'user_id = :id OR listing_id IN ({USER_LISTINGS})', 'id'),
+            ('activity_log', 'user_id = :id', 'id'),
+            ('subscriptions', 'user_id = :id', 'id'),
+            ('listings', 'user_id = :id', 'id'),
+            ('executor_category_affinity', 'user_id = :id', 'category'),
+            ('executor_stats', 'user_id = :id', 'user_id')
+        ],
+        # Remaining small rows (memberships, profile) cascade from this delete
+        'table': 'users'
+    }
+}
+
+# Helper function to queue a deletion job in the caller's transaction.
+# Returns the id of the new or already queued job.
+def enqueue_deletion(conn, entity, entity_id):
+    if entity not in DELETION_PLANS:
+        raise ValueError(f'Unknown deletion entity: {entity}')
+
+    job = conn.execute('''
+        SELECT id FROM deletion_jobs
+        WHERE entity = ? AND entity_id = ? AND status IN ('pending', 'running')
+    ''', (entity, entity_id)).fetchone()
+    if job:
+        return job['id']
+
+    cursor = conn.execute('INSERT INTO deletion_jobs (entity, entity_id) VALUES (?, ?)', (entity, entity_id))
+    return cursor.lastrowid
+
+class DeletionWorker:
+    """Daemon thread that runs queued deletion jobs batch by batch."""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._next_prune = 0
+
+    # Start the worker thread if it is not running yet
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='deletion-worker', daemon=True)
+                self._thread.start()
+
+    # Wake up the worker after a job was committed
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while self.run_next():
+                    pass
+            except Exception:
+                logger.exception('Deletion worker failed')
+            try:
+                self.prune_if_due()
+            except Exception:
+                logger.exception('Pruning change_log failed')
+            self._wakeup.wait(DELETION_POLL_INTERVAL)
+
+    # Prune change_log if CHANGE_LOG_PRUNE_INTERVAL has passed since the last prune
+    def prune_if_due(self):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + CHANGE_LOG_PRUNE_INTERVAL
+
+        conn = connect(self.db_path)
+        try:
+            pruned = prune_change_log(conn)
+            if pruned:
+                logger.info('Pruned %d change_log entries', pruned)
+        finally:
+            conn.close()
+
+    # Run the oldest queued job. Returns False if there was none.
+    def run_next(self):
+        conn = connect(self.db_path)
+        try:
+            # Jobs left running by a stopped process are picked up again
+            job = conn.execute('''
+                SELECT * FROM deletion_jobs
+                WHERE status IN ('pending', 'running')
+                ORDER BY id
+                LIMIT 1
+            ''').fetchone()
+            if not job:
+                return False
+
+            conn.execute("UPDATE deletion_jobs SET status = 'running' WHERE id = ?", (job['id'],))
+            conn.commit()
+
+            try:
+                self.run_job(conn, job)
+            except Exception as e:
+                conn.rollback()
+                conn.execute('''
+                    UPDATE deletion_jobs
+                    SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (str(e), job['id']))
+                conn.commit()
+            return True
+        finally:
+            conn.close()
+
+    # Delete the rows of a job's plan in batches, one transaction per batch
+    def run_job(self, conn, job):
+        plan = DELETION_PLANS[job['entity']]
+        params = {'id': job['entity_id']}
+
+        for table, condition, key in plan['steps']:
+            while True:
+                cursor = conn.execute(f'''
+                    DELETE FROM {table}
+                    WHERE ({condition})
+                    AND {key} IN (SELECT {key} FROM {table} WHERE {condition} LIMIT {DELETION_BATCH_SIZE})
+                ''', params)
+                deleted = cursor.rowcount
+                conn.execute('UPDATE deletion_jobs SET deleted_rows = deleted_rows + ? WHERE id = ?',
+                             (deleted, job['id']))
+                conn.commit()
+
+                if deleted < DELETION_BATCH_SIZE:
+                    break
+                time.sleep(DELETION_BATCH_PAUSE)
+
+        cursor = conn.execute(f"DELETE FROM {plan['table']} WHERE id = :id", params)
+        conn.execute('''
+            UPDATE deletion_jobs
+            SET status = 'done', deleted_rows = deleted_rows + ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (cursor.rowcount, job['id']))
+        conn.commit()
+
+# Worker shared by all blueprints of the process
+deletion_worker = DeletionWorker()
@@ -0,0 +1,84 @@
+"""
+In-process event hub for the Metal-Rezerv API.
+Route handlers publish events after their transaction commits and the
+Server-Sent Events stream delivers them to the users in each event's audience.
+
+Events are kept in a bounded ring buffer with increasing ids, so a client
+can resume from its Last-Event-ID as long as the event is still buffered.
+Subscribers share one condition variable instead of owning a queue each,
+which keeps idle connections cheap: publishing is O(1) and a waiting stream
+only holds its thread (or greenlet) and its last seen event id. The hub
+lives in one process; every worker process delivers its own events.
+"""
+
+import json
+import threading
+from collections import deque
+
+# Number of recent events kept for resuming streams
+EVENT_HISTORY_SIZE = 5000
+
+class EventHub:
+    """Ring buffer of recent events that subscribers wait on."""
+
+    def __init__(self, history_size=EVENT_HISTORY_SIZE):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history_size)
+        self._last_id = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    # Publish an event to the given user ids and wake up all waiting streams
+    def publish(self, event_type, data, audience):
+        audience = frozenset(user_id for user_id in audience if user_id is not None)
+        if not audience:
+            return None
+
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data, audience))
+            self._condition.notify_all()
+            return self._last_id
+
+    # Get the events of a user published after last_id.
+    # Returns (events, newest id, missed) where missed tells that older
+    # events were already dropped from the buffer.
+    def read(self, user_id, last_id):
+        with self._condition:
+            newest_id = self._last_id
+            if last_id > newest_id:
+                # The id comes from before a restart of the process
+                return [], newest_id, True
+            if last_id == newest_id:
+                return [], newest_id, False
+
+            events = []
+            # Events are ordered by id, so walk back only over the new ones
+            for event in reversed(self._events):
+                if event[0] <= last_id:
+                    break
+                if user_id in event[3]:
+                    events.append(event[:3])
+            events.reverse()
+
+            oldest_id = self._events[0][0] if self._events else newest_id + 1
+            missed = last_id < oldest_id - 1
+            return events, newest_id, missed
+
+    # Block until an event newer than last_id is published or the timeout expires
+    def wait(self, last_id, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._last_id > last_id, timeout)
+
+# Hub shared by all blueprints of the process
+hub = EventHub()
+
+# Helper function to publish an event after a successful commit
+def publish_event(event_type, data, audience):
+    return hub.publish(event_type, data, audience)
+
+# Helper function to format one Server-Sent Event
+def format_sse(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
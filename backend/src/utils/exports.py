@@ -0,0 +1,194 @@
+"""
+Streaming data exports for the Metal-Rezerv API.
+Builds filtered export queries and streams their rows as CSV or NDJSON
+straight from the database cursor, optionally gzip-compressed on the fly.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from flask import Response, request
+
+# Number of rows pulled from the cursor per batch
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Base query, created_at column and supported filters of every exportable entity.
+# Filters map a query parameter to the column it is compared with.
+EXPORT_ENTITIES = {
+    'listings': {
+        'query': 'SELECT l.* FROM listings l',
+        'created_at': 'l.created_at',
+        'filters': {
+            'status': 'l.status',
+            'category': 'l.category',
+            'user_id': 'l.user_id'
+        },
+        'company_columns': ['l.company_id']
+    },
+    'responses': {
+        'query': '''
+            SELECT r.*, l.title as listing_title, l.category, l.status as listing_status
+            FROM responses r
+            JOIN listings l ON r.listing_id = l.id
+        ''',
+        'created_at': 'r.created_at',
+        'filters': {
+            'status': 'r.status',
+            'category': 'l.category',
+            'listing_id': 'r.listing_id',
+            'user_id': 'r.user_id'
+        },
+        # Responses sent by the company and responses received on its listings
+        'company_columns': ['r.company_id', 'l.company_id']
+    },
+    'transactions': {
+        'query': 'SELECT bt.* FROM balance_transactions bt',
+        'created_at': 'bt.created_at',
+        'filters': {
+            'transaction_type': 'bt.transaction_type',
+            'user_id': 'bt.user_id'
+        },
+        'company_columns': ['bt.company_id']
+    },
+    'activity-log': {
+        'query': '''
+            SELECT al.*, u.email as user_email
+            FROM activity_log al
+            JOIN users u ON al.user_id = u.id
+        ''',
+        'created_at': 'al.created_at',
+        'filters': {
+            'action_type': 'al.action_type',
+            'user_id': 'al.user_id'
+        },
+        'company_columns': ['al.company_id']
+    }
+}
+
+# Helper function to validate a YYYY-MM-DD query parameter
+def parse_date_param(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Invalid {name}, expected YYYY-MM-DD')
+    return value
+
+# Build the filtered export query of an entity.
+# company_id restricts the export to one company; raises ValueError on bad input.
+def build_export_query(entity, args, company_id=None):
+    config = EXPORT_ENTITIES.get(entity)
+    if not config:
+        raise ValueError(f'Unknown export: {entity}')
+
+    where_clauses = []
+    params = []
+
+    for param, column in config['filters'].items():
+        value = args.get(param)
+        if value:
+            where_clauses.append(f'{column} = ?')
+            params.append(value)
+
+    date_from = parse_date_param(args, 'date_from')
+    if date_from:
+        where_clauses.append(f"{config['created_at']} >= ?")
+        params.append(date_from)
+
+    date_to = parse_date_param(args, 'date_to')
+    if date_to:
+        where_clauses.append(f"{config['created_at']} < date(?, '+1 day')")
+        params.append(date_to)
+
+    if company_id is not None:
+        company_clauses = [f'{column} = ?' for column in config['company_columns']]
+        where_clauses.append('(' + ' OR '.join(company_clauses) + ')')
+        params.extend([company_id] * len(company_clauses))
+
+    query = config['query']
+    if where_clauses:
+        query += ' WHERE ' + ' AND '.join(where_clauses)
+    query += f" ORDER BY {config['created_at']} DESC"
+
+    return query, params
+
+# Helper function to read the requested export format
+def get_export_format(args):
+    fmt = args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError('Invalid format. Must be "csv" or "ndjson"')
+    return fmt
+
+# Helper function to decide whether the export is gzip-compressed.
+# Compression is on when the client accepts gzip, unless ?gzip=0 is passed.
+def wants_gzip(args):
+    if args.get('gzip', '').lower() in ('0', 'false', 'no'):
+        return False
+    return request.accept_encodings['gzip'] > 0
+
+# Generator yielding encoded export chunks, one per cursor batch
+def generate_export_chunks(conn, cursor, fmt, use_gzip):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if use_gzip else None
+
+    def encode(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    try:
+        columns = [column[0] for column in cursor.description]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        if fmt == 'csv':
+            writer.writerow(columns)
+
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                    buffer.write('\n')
+
+            chunk = encode(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            if chunk:
+                yield chunk
+
+        # Header-only CSV of an empty export still has to be sent
+        chunk = encode(buffer.getvalue())
+        if chunk:
+            yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        conn.close()
+
+# Stream the rows of an export query as a downloadable response.
+# The response owns the connection and closes it once streaming ends.
+def stream_export(conn, query, params, fmt, name, use_gzip):
+    cursor = conn.execute(query, params)
+
+    response = Response(
+        generate_export_chunks(conn, cursor, fmt, use_gzip),
+        content_type=EXPORT_FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,52 @@
+"""
+Fast JSON serialization for the Metal-Rezerv API.
+Encodes sqlite3.Row objects directly, so handlers can return query results
+without first copying every row into a dict. Uses orjson when it is
+installed and the standard json module otherwise; dates and datetimes are
+written as ISO 8601 strings by both.
+"""
+
+import json
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from flask import current_app
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Helper function to convert values the encoders do not support natively
+def encode_default(value):
+    if isinstance(value, sqlite3.Row):
+        return dict(zip(value.keys(), value))
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+# Serialize a value to UTF-8 encoded JSON bytes
+if orjson is not None:
+    def dumps(value):
+        return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(value):
+        return json.dumps(value, default=encode_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class RowJSONEncoder(JSONEncoder):
+    """Flask JSON encoder that also accepts sqlite3.Row values, so jsonify works on rows."""
+
+    def default(self, o):
+        try:
+            return encode_default(o)
+        except TypeError:
+            return super().default(o)
+
+# Build a JSON response through the fast encoder
+def json_response(value):
+    return current_app.response_class(dumps(value), mimetype='application/json')
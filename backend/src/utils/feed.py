@@ -0,0 +1,251 @@
+"""
+Personalized listing feed for executors.
+Scores published listings per executor from precomputed features:
+category affinity (executor_category_affinity), region match, freshness
+and competition (listing_stats), weighted by the executor's experience
+and review history.
+
+Each executor's candidate set is cached in memory and refreshed
+incrementally from change_log, so a feed page only reads the listings it
+returns instead of scanning all published listings.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Candidate generation
+FEED_TOP_CATEGORIES = 5
+FEED_CANDIDATES_PER_CATEGORY = 200
+FEED_RECENT_CANDIDATES = 200
+FEED_MAX_CANDIDATES = 1000
+
+# Cache settings
+FEED_CACHE_SIZE = 1000  # executors kept in memory
+FEED_CACHE_TTL = 600  # seconds before a candidate set is rebuilt
+FEED_MAX_CHANGES = 2000  # more pending changes than this trigger a rebuild
+
+# Scoring weights
+AFFINITY_WEIGHT = 3.0
+CITY_MATCH_WEIGHT = 1.5
+COUNTRY_MATCH_WEIGHT = 0.75
+FRESHNESS_WEIGHT = 2.0
+FRESHNESS_HALF_LIFE_DAYS = 7
+COMPETITION_WEIGHT = 1.0
+
+# Experienced executors are less put off by listings with many responses
+COMPETITION_FACTORS = {
+    'BEGINNER': 1.0,
+    'EXPERIENCED': 0.6,
+    'EXPERT': 0.3
+}
+# Well reviewed executors are treated like one level more experienced
+STRONG_REVIEWS_MIN_COUNT = 3
+STRONG_REVIEWS_MIN_AVERAGE = 4.5
+STRONG_REVIEWS_FACTOR = 0.5
+
+CANDIDATE_COLUMNS = '''
+    l.id, l.category, l.created_at, l.status, l.user_id, l.city, l.country,
+    COALESCE(ls.responses_count, 0) as responses_count
+'''
+
+CANDIDATE_JOINS = '''
+    FROM listings l
+    LEFT JOIN listing_stats ls ON ls.listing_id = l.id
+'''
+
+# Listings the executor has already responded to are not candidates
+NOT_RESPONDED_FILTER = '''
+    AND NOT EXISTS (SELECT 1 FROM responses r WHERE r.listing_id = l.id AND r.user_id = ?)
+'''
+
+# Helper function to normalize region values for comparison
+def normalize(value):
+    return (value or '').strip().lower()
+
+def parse_timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+class ExecutorFeed:
+    """Scored candidate listings of one executor."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.built_at = 0
+        self.seq = 0
+        self.scores = {}
+        self.ranking = None
+
+    # Load the executor features used for scoring
+    def load_features(self, conn):
+        user = conn.execute('''
+            SELECT u.city, u.country, ep.experience_level
+            FROM users u
+            LEFT JOIN executor_profiles ep ON ep.user_id = u.id
+            WHERE u.id = ?
+        ''', (self.user_id,)).fetchone()
+
+        reviews = conn.execute('''
+            SELECT COUNT(*) as count, AVG(rating) as average
+            FROM reviews
+            WHERE executor_id = ?
+        ''', (self.user_id,)).fetchone()
+
+        affinity_rows = conn.execute('''
+            SELECT category, responses_count
+            FROM executor_category_affinity
+            WHERE user_id = ?
+            ORDER BY responses_count DESC
+        ''', (self.user_id,)).fetchall()
+
+        total_responses = sum(row['responses_count'] for row in affinity_rows) or 1
+        self.affinity = {row['category']: row['responses_count'] / total_responses for row in affinity_rows}
+        self.top_categories = [row['category'] for row in affinity_rows[:FEED_TOP_CATEGORIES]]
+
+        self.city = normalize(user['city']) if user else ''
+        self.country = normalize(user['country']) if user else ''
+
+        level = (user['experience_level'] if user else None) or 'BEGINNER'
+        self.competition_factor = COMPETITION_FACTORS.get(level, 1.0)
+        if (reviews['count'] >= STRONG_REVIEWS_MIN_COUNT
+                and reviews['average'] >= STRONG_REVIEWS_MIN_AVERAGE):
+            self.competition_factor *= STRONG_REVIEWS_FACTOR
+
+    # Score one candidate row; freshness is measured against the build time
+    # so the ranking stays stable until the next rebuild
+    def score(self, row):
+        score = AFFINITY_WEIGHT * self.affinity.get(row['category'], 0)
+
+        if self.country and normalize(row['country']) == self.country:
+            score += COUNTRY_MATCH_WEIGHT
+            if self.city and normalize(row['city']) == self.city:
+                score += CITY_MATCH_WEIGHT
+
+        age_days = max(0, self.built_at - parse_timestamp(row['created_at']).timestamp()) / 86400
+        score += FRESHNESS_WEIGHT * 0.5 ** (age_days / FRESHNESS_HALF_LIFE_DAYS)
+
+        score -= COMPETITION_WEIGHT * self.competition_factor * math.log1p(row['responses_count'])
+        return score
+
+    # Check if a listing row can be shown to the executor
+    def is_candidate(self, row):
+        return row['status'] == 'published' and row['user_id'] != self.user_id
+
+    # Build the candidate set from scratch
+    def rebuild(self, conn):
+        self.seq = conn.execute('SELECT COALESCE(MAX(seq), 0) as seq FROM change_log').fetchone()['seq']
+        self.built_at = time.time()
+        self.load_features(conn)
+
+        not_responded = f'AND l.user_id != ? {NOT_RESPONDED_FILTER}'
+
+        rows = []
+        # Newest listings of the executor's favourite categories
+        for category in self.top_categories:
+            rows.extend(conn.execute(f'''
+                SELECT {CANDIDATE_COLUMNS} {CANDIDATE_JOINS}
+                WHERE l.status = 'published' AND l.category = ? {not_responded}
+                ORDER BY l.created_at DESC
+                LIMIT ?
+            ''', (category, self.user_id, self.user_id, FEED_CANDIDATES_PER_CATEGORY)).fetchall())
+
+        # Newest listings overall, so executors without history still get a feed
+        rows.extend(conn.execute(f'''
+            SELECT {CANDIDATE_COLUMNS} {CANDIDATE_JOINS}
+            WHERE l.status = 'published' {not_responded}
+            ORDER BY l.created_at DESC
+            LIMIT ?
+        ''', (self.user_id, self.user_id, FEED_RECENT_CANDIDATES)).fetchall())
+
+        self.scores = {row['id']: self.score(row) for row in rows}
+        self.ranking = None
+
+    # Apply listing and response changes committed since the last refresh.
+    # Returns False if there are too many changes and a rebuild is cheaper.
+    def refresh(self, conn):
+        changes = conn.execute('''
+            SELECT seq, table_name, row_id, operation, user_id, listing_id
+            FROM change_log
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        ''', (self.seq, FEED_MAX_CHANGES + 1)).fetchall()
+
+        if not changes:
+            return True
+        if len(changes) > FEED_MAX_CHANGES:
+            return False
+
+        changed_listings = set()
+        for change in changes:
+            if change['table_name'] == 'responses' and change['user_id'] == self.user_id:
+                # The executor's own responses change affinity and candidates
+                return False
+            if change['table_name'] == 'listings':
+                changed_listings.add(change['row_id'])
+            elif change['listing_id'] in self.scores:
+                # Other executors' responses change the competition
+                changed_listings.add(change['listing_id'])
+
+        if changed_listings:
+            ids = list(changed_listings)
+            placeholders = ', '.join(['?'] * len(ids))
+            # Listings the executor responded to meanwhile are dropped like in rebuild
+            rows = {row['id']: row for row in conn.execute(f'''
+                SELECT {CANDIDATE_COLUMNS} {CANDIDATE_JOINS}
+                WHERE l.id IN ({placeholders}) {NOT_RESPONDED_FILTER}
+            ''', ids + [self.user_id])}
+
+            for listing_id in ids:
+                row = rows.get(listing_id)
+                if row is not None and self.is_candidate(row):
+                    self.scores[listing_id] = self.score(row)
+                else:
+                    self.scores.pop(listing_id, None)
+
+            # Keep the best candidates only
+            if len(self.scores) > FEED_MAX_CANDIDATES:
+                best = sorted(self.scores.items(), key=lambda item: item[1], reverse=True)
+                self.scores = dict(best[:FEED_MAX_CANDIDATES])
+            self.ranking = None
+
+        self.seq = changes[-1]['seq']
+        return True
+
+    # Get (listing_id, score) pairs of a page and the total number of candidates
+    def page(self, conn, offset, limit):
+        with self.lock:
+            expired = time.time() - self.built_at > FEED_CACHE_TTL
+            if expired or not self.refresh(conn):
+                self.rebuild(conn)
+
+            if self.ranking is None:
+                self.ranking = sorted(self.scores.items(), key=lambda item: (-item[1], -item[0]))
+
+            return self.ranking[offset:offset + limit], len(self.ranking)
+
+class FeedCache:
+    """LRU cache of executor feeds."""
+
+    def __init__(self, size=FEED_CACHE_SIZE):
+        self._lock = threading.Lock()
+        self._feeds = OrderedDict()
+        self._size = size
+
+    def get(self, user_id):
+        with self._lock:
+            feed = self._feeds.get(user_id)
+            if feed is None:
+                feed = ExecutorFeed(user_id)
+                self._feeds[user_id] = feed
+                if len(self._feeds) > self._size:
+                    self._feeds.popitem(last=False)
+            else:
+                self._feeds.move_to_end(user_id)
+            return feed
+
+# Feed cache shared by all blueprints of the process
+feed_cache = FeedCache()
@@ -0,0 +1,66 @@
+"""
+HTTP cache validators for the Metal-Rezerv API.
+Derives ETag / Last-Modified values from the per-table change counters in
+table_versions, so conditional GETs can be answered with 304 Not Modified
+before the page query runs.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from flask import request, make_response
+
+# Helper function to read the change counters of the given tables.
+# Returns the version string and the last modification time (UTC).
+def get_table_versions(conn, tables):
+    placeholders = ', '.join(['?'] * len(tables))
+    rows = conn.execute(f'''
+        SELECT table_name, version, updated_at
+        FROM table_versions
+        WHERE table_name IN ({placeholders})
+        ORDER BY table_name
+    ''', list(tables)).fetchall()
+
+    version = ','.join(f"{row['table_name']}:{row['version']}" for row in rows)
+
+    last_modified = None
+    for row in rows:
+        if row['updated_at']:
+            modified = datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            if last_modified is None or modified > last_modified:
+                last_modified = modified
+
+    return version, last_modified
+
+# Build the validators of a response depending on the given tables.
+# key_parts identify the representation (user, query string, ...).
+def get_validators(conn, tables, *key_parts):
+    version, last_modified = get_table_versions(conn, tables)
+    key = '|'.join([version] + [str(part) for part in key_parts])
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+# Check the request's conditional headers against the validators.
+# If-None-Match takes precedence over If-Modified-Since (RFC 7232).
+def is_not_modified(validators):
+    etag, last_modified = validators
+
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+
+    return False
+
+# Attach the validators to a response; clients must revalidate on every use
+def add_validators(response, validators):
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Empty 304 response carrying the current validators
+def not_modified_response(validators):
+    return add_validators(make_response('', 304), validators)
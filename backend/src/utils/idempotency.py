@@ -0,0 +1,194 @@
+"""
+Idempotent POST requests for the Metal-Rezerv API.
+Clients send an Idempotency-Key header with requests they may retry. The
+first request with a key is executed and its response stored in the
+idempotency_keys table; retries with the same key replay the stored response
+without touching the business tables. A retry arriving while the first
+request is still running polls the key on the read lane for its result. Keys
+are scoped per user and expire after IDEMPOTENCY_TTL.
+
+The response is stored after the request has committed its own changes. A
+key whose request never finished recording (the process died, or storing the
+response failed) stays in progress and answers 409 until it expires; it is
+never run again, as the business changes may already be committed.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from src.utils.db import connect
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Seconds a stored response is replayed
+IDEMPOTENCY_TTL = 24 * 3600
+
+# Seconds a duplicate waits for the first request, and its polling delays
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+IDEMPOTENCY_POLL_MAX_INTERVAL = 0.5
+
+# Statuses that depend on the moment rather than the request (timeouts,
+# throttling, server errors). They are not stored, so a retry runs again.
+IDEMPOTENCY_TRANSIENT_STATUSES = {408, 425, 429}
+
+# Expired keys removed per claimed key
+IDEMPOTENCY_CLEANUP_BATCH = 100
+
+# Helper function to fingerprint the method, path and body of the request
+def hash_request():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(b'\n')
+    digest.update(request.path.encode('utf-8'))
+    digest.update(b'\n')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+# Helper function to check if a response must not be replayed
+def is_transient(response):
+    return response.status_code >= 500 or response.status_code in IDEMPOTENCY_TRANSIENT_STATUSES
+
+# Try to claim a key for this request. Returns (True, None) if it was
+# claimed, otherwise (False, row of the existing key) - the row may be None
+# if the key was released in the meantime. Keys in progress are never taken
+# over, only expired ones.
+def claim_key(conn, user_id, key, request_hash):
+    # Drop some expired keys, so the table does not grow
+    conn.execute('''
+        DELETE FROM idempotency_keys WHERE rowid IN (
+            SELECT rowid FROM idempotency_keys WHERE expires_at < CURRENT_TIMESTAMP LIMIT ?
+        )
+    ''', (IDEMPOTENCY_CLEANUP_BATCH,))
+
+    # An expired key can be claimed again
+    conn.execute('''
+        DELETE FROM idempotency_keys
+        WHERE user_id = ? AND key = ? AND expires_at < CURRENT_TIMESTAMP
+    ''', (user_id, key))
+
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO idempotency_keys (user_id, key, request_hash, expires_at)
+        VALUES (?, ?, ?, datetime('now', ?))
+    ''', (user_id, key, request_hash, f'+{IDEMPOTENCY_TTL} seconds'))
+    conn.commit()
+
+    if cursor.rowcount == 1:
+        return True, None
+
+    return False, read_key(conn, user_id, key)
+
+# Get the row of a key, or None
+def read_key(conn, user_id, key):
+    return conn.execute('SELECT * FROM idempotency_keys WHERE user_id = ? AND key = ?', (user_id, key)).fetchone()
+
+# Store the response of a claimed key
+def store_response(conn, user_id, key, response):
+    conn.execute('''
+        UPDATE idempotency_keys
+        SET status = 'completed', response_status = ?, response_body = ?, response_mimetype = ?
+        WHERE user_id = ? AND key = ?
+    ''', (response.status_code, response.get_data(as_text=True), response.mimetype, user_id, key))
+    conn.commit()
+
+# Release a claimed key, so the request can be retried
+def release_key(conn, user_id, key):
+    conn.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND key = ?', (user_id, key))
+    conn.commit()
+
+# Build the replay of a stored response
+def replay_response(row):
+    response = current_app.response_class(
+        row['response_body'],
+        status=row['response_status'],
+        mimetype=row['response_mimetype']
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+# Decorator making a POST route idempotent for requests with an Idempotency-Key.
+# Goes below token_required; keys are scoped to the current user.
+# Transient responses (see is_transient) are not stored, so the client can retry them.
+def idempotent(f):
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return f(current_user, *args, **kwargs)
+
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_KEY_HEADER} is too long'}), 400
+
+        user_id = current_user['id']
+        request_hash = hash_request()
+
+        conn = connect(DB_PATH, readonly=False)
+        read_conn = None
+        try:
+            deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+            delay = IDEMPOTENCY_POLL_INTERVAL
+            row = None
+            while True:
+                # Only a missing key is claimed; a key that exists is polled
+                # read-only until it completes or is released
+                if row is None:
+                    claimed, row = claim_key(conn, user_id, key, request_hash)
+                    if claimed:
+                        break
+
+                # A row released in the meantime is waited for like one in
+                # progress, then claimed again
+                if row is not None:
+                    if row['request_hash'] != request_hash:
+                        return jsonify({'error': f'{IDEMPOTENCY_KEY_HEADER} was already used for a different request'}), 422
+
+                    if row['status'] == 'completed':
+                        return replay_response(row)
+
+                # The first request is still running, wait for its result
+                if time.monotonic() >= deadline:
+                    response = jsonify({'error': 'A request with this idempotency key is still in progress'})
+                    response.status_code = 409
+                    response.headers['Retry-After'] = '1'
+                    return response
+
+                time.sleep(delay)
+                delay = min(delay * 2, IDEMPOTENCY_POLL_MAX_INTERVAL)
+
+                if read_conn is None:
+                    read_conn = connect(DB_PATH, readonly=True)
+                row = read_key(read_conn, user_id, key)
+
+            try:
+                response = make_response(f(current_user, *args, **kwargs))
+            except Exception:
+                release_key(conn, user_id, key)
+                raise
+
+            try:
+                if is_transient(response) or response.is_streamed:
+                    release_key(conn, user_id, key)
+                else:
+                    store_response(conn, user_id, key, response)
+            except sqlite3.Error:
+                # The request has run; answer it. Its key stays in progress,
+                # so retries get 409 instead of running it again.
+                logger.exception('Could not record idempotency key')
+
+            return response
+        finally:
+            conn.close()
+            if read_conn is not None:
+                read_conn.close()
+
+    return decorated
@@ -0,0 +1,38 @@
+"""
+Sparse fieldsets for list endpoints of the Metal-Rezerv API.
+Translates the fields= and view= query parameters into a narrow SELECT
+column list, so card views do not read or send full descriptions.
+"""
+
+# Get the field names requested with ?fields=a,b or a named ?view=.
+# fields maps every selectable name to its SQL expression; views maps a
+# view name to its field names. The id field is always included.
+# Raises ValueError with a client-facing message if the request is invalid.
+def get_requested_fields(args, fields, views, default_view='full'):
+    requested = args.get('fields')
+    if requested:
+        names = []
+        for name in requested.split(','):
+            name = name.strip()
+            if name and name not in names:
+                names.append(name)
+
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return names
+
+    view = args.get('view', default_view)
+    if view not in views:
+        raise ValueError(f"Invalid view, expected one of: {', '.join(views)}")
+    return list(views[view])
+
+# Build the SELECT column list of the given field names
+def build_select_list(names, fields):
+    return ', '.join(
+        fields[name] if fields[name] == name else f'{fields[name]} as {name}'
+        for name in names
+    )
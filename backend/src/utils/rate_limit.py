@@ -0,0 +1,187 @@
+"""
+Request rate limiting for the Metal-Rezerv API.
+Token buckets keyed by client IP, login email or user id, declared per route
+with the rate_limit decorator. A bucket holds up to `limit` requests and
+refills at `limit` per `period` seconds, so short bursts pass while sustained
+floods get 429 Too Many Requests with Retry-After.
+
+Buckets live in process memory by default. Set RATE_LIMIT_BACKEND=sqlite to
+share them between the worker processes of a host through a small local
+SQLite file. Either backend keeps one small record per active key and evicts
+idle keys.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify
+
+logger = logging.getLogger(__name__)
+
+# Backend of the limiter: 'memory' (per process) or 'sqlite' (per host)
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+# State file of the sqlite backend, separate from the main database
+RATE_LIMIT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'rate_limits.db')
+
+# Buckets kept by the memory backend before the least recently used is evicted
+RATE_LIMIT_MAX_KEYS = 100000
+
+# Seconds after which an idle bucket is full again and can be dropped
+RATE_LIMIT_IDLE_TTL = 3600
+
+# sqlite backend: operations between sweeps of idle buckets
+RATE_LIMIT_SWEEP_EVERY = 1000
+
+# Helper function to refill a bucket and take one token.
+# Returns (allowed, tokens left, seconds until the next token).
+def take_token(tokens, updated_at, now, limit, period):
+    rate = limit / period
+    if tokens is None:
+        tokens = float(limit)
+    else:
+        tokens = min(float(limit), tokens + (now - updated_at) * rate)
+
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, (1 - tokens) / rate
+
+class MemoryBackend:
+    """Buckets of one process in an LRU dict bounded by RATE_LIMIT_MAX_KEYS."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._max_keys = max_keys
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (None, now))
+            allowed, tokens, retry_after = take_token(tokens, updated_at, now, limit, period)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+class SQLiteBackend:
+    """Buckets shared by the processes of a host through a local SQLite file."""
+
+    def __init__(self, db_path=RATE_LIMIT_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._operations = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Limiter state is disposable, losing the last writes on a crash is fine
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, limit, period):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row else (None, now)
+            allowed, tokens, retry_after = take_token(tokens, updated_at, now, limit, period)
+            conn.execute('''
+                INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (key, tokens, now))
+
+            with self._lock:
+                self._operations += 1
+                sweep = self._operations % RATE_LIMIT_SWEEP_EVERY == 0
+            if sweep:
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - RATE_LIMIT_IDLE_TTL,))
+
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+# Create the backend selected by RATE_LIMIT_BACKEND
+def create_backend(name=RATE_LIMIT_BACKEND):
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f'Unknown rate limit backend: {name}')
+
+# Backend shared by all routes of the process
+rate_limit_backend = create_backend()
+
+# Helper functions to get the key of a request for each key type.
+# user keys read the current_user passed by token_required. Behind reverse
+# proxies, remote_addr is the client address set by ProxyFix (see
+# TRUSTED_PROXY_COUNT in main.py).
+def client_ip(args):
+    return request.remote_addr or 'unknown'
+
+def request_email(args):
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def current_user_id(args):
+    return str(args[0]['id']) if args and isinstance(args[0], dict) else None
+
+RATE_LIMIT_KEYS = {
+    'ip': client_ip,
+    'email': request_email,
+    'user': current_user_id
+}
+
+# Build the 429 response of a limited request
+def rate_limited_response(retry_after):
+    response = jsonify({'error': 'Too many requests, try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+# Decorator allowing `limit` requests per `period` seconds per key.
+# Decorators can be stacked to limit a route by several keys; requests
+# without a key (e.g. no email in the body) are not limited by it.
+def rate_limit(name, limit, period, key='ip'):
+    get_key = RATE_LIMIT_KEYS[key]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            value = get_key(args)
+            if value is not None:
+                try:
+                    allowed, retry_after = rate_limit_backend.hit(f'{name}:{key}:{value}', limit, period)
+                except Exception:
+                    # Never fail a request because the limiter is unavailable
+                    logger.exception('Rate limiter failed')
+                    allowed = True
+
+                if not allowed:
+                    return rate_limited_response(retry_after)
+
+            return f(*args, **kwargs)
+
+        return decorated
+    return decorator
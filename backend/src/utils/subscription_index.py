@@ -0,0 +1,86 @@
+"""
+Subscription index for the Metal-Rezerv API.
+Keeps an in-memory inverted index from (category, city, country) to the ids
+of subscribed executors, so a new listing is matched against its subscribers
+without scanning all executors.
+
+The subscriptions table is the persisted copy of the index. The change
+counter of that table in table_versions tells when another process changed
+subscriptions, in which case the index is reloaded from the table.
+"""
+
+import threading
+
+# Helper function to normalize a subscription or listing value for matching
+def normalize(value):
+    return (value or '').strip().lower()
+
+class SubscriptionIndex:
+    """Inverted index from (category, city, country) to subscriber ids."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = {}
+        self._version = None
+
+    # Helper function to read the committed change counter of subscriptions
+    def _read_version(self, conn):
+        row = conn.execute(
+            "SELECT version FROM table_versions WHERE table_name = 'subscriptions'"
+        ).fetchone()
+        return row['version'] if row else 0
+
+    def _reload(self, conn, version):
+        index = {}
+        for row in conn.execute('SELECT user_id, category, city, country FROM subscriptions'):
+            key = (row['category'], row['city'], row['country'])
+            index.setdefault(key, set()).add(row['user_id'])
+        self._index = index
+        self._version = version
+
+    # Reload the index if subscriptions changed since it was loaded
+    def ensure_fresh(self, conn):
+        version = self._read_version(conn)
+        with self._lock:
+            if version != self._version:
+                self._reload(conn, version)
+
+    # Get the ids of users subscribed to a listing's category and region.
+    # Costs one lookup per region level plus the size of the matching sets.
+    def match(self, conn, category, city, country):
+        self.ensure_fresh(conn)
+        return self.lookup(category, city, country)
+
+    # Same as match, for callers that already called ensure_fresh
+    def lookup(self, category, city, country):
+        category, city, country = normalize(category), normalize(city), normalize(country)
+        keys = {(category, '', ''), (category, city, ''), (category, '', country), (category, city, country)}
+
+        subscribers = set()
+        with self._lock:
+            for key in keys:
+                subscribers |= self._index.get(key, set())
+        return subscribers
+
+    # Apply subscription rows that were just committed through conn.
+    # The index stays incremental only if no other change happened since it
+    # was loaded; otherwise it reloads on next use.
+    def apply(self, conn, added=(), removed=()):
+        version = self._read_version(conn)
+        with self._lock:
+            if self._version is None or version != self._version + len(added) + len(removed):
+                self._version = None
+                return
+
+            for user_id, category, city, country in added:
+                self._index.setdefault((category, city, country), set()).add(user_id)
+            for user_id, category, city, country in removed:
+                subscribers = self._index.get((category, city, country))
+                if subscribers:
+                    subscribers.discard(user_id)
+                    if not subscribers:
+                        del self._index[(category, city, country)]
+            self._version = version
+
+# Index shared by all blueprints of the process
+subscription_index = SubscriptionIndex()
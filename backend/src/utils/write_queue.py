@@ -0,0 +1,268 @@
+"""
+Write coordination for the Metal-Rezerv API.
+Hot write paths hand their transaction to a single writer thread per process
+instead of competing for the SQLite write lock on their own connections.
+
+The writer drains every job queued while it was busy and runs them in one
+BEGIN IMMEDIATE transaction, each job inside its own savepoint, so a failing
+job only rolls back its own changes and one commit covers the whole group.
+A group that can not get the lock is retried with a doubling backoff; the
+writer connection only waits WRITE_BUSY_TIMEOUT for the lock itself, so the
+backoff is the only retry wait. Every job has one deadline covering its time
+in the queue and the retries of its group: a full queue or an expired
+deadline surfaces as WriteUnavailable, answered with 503 and Retry-After.
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from flask import jsonify
+from src.utils.db import connect_writer
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'metal_rezerv.db')
+
+# Jobs waiting for the writer before new ones are rejected
+WRITE_QUEUE_MAX = 1000
+
+# Jobs committed together at most
+GROUP_COMMIT_MAX = 50
+
+# Seconds a job may wait in the queue and in retries before giving up
+WRITE_WAIT_TIMEOUT = 15
+
+# Seconds the writer connection waits for a lock held by another process
+WRITE_BUSY_TIMEOUT = 0.1
+
+# Delays in seconds between attempts to run a locked group (doubled on
+# every attempt up to the maximum, no jitter)
+WRITE_RETRY_BASE_DELAY = 0.05
+WRITE_RETRY_MAX_DELAY = 1
+
+# Retry-After in seconds sent with 503 responses
+WRITE_RETRY_AFTER = 1
+
+class WriteUnavailable(Exception):
+    """The write could not be queued or did not start in time."""
+
+    def __init__(self, message, retry_after=WRITE_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class WriteJob:
+    """A function run on the writer connection, and its outcome."""
+
+    def __init__(self, fn, deadline):
+        self.fn = fn
+        self.deadline = deadline
+        self.result = None
+        self.error = None
+        self._state = 'pending'
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    # Move a pending job to running. Returns False if it was cancelled.
+    def claim(self):
+        with self._lock:
+            if self._state != 'pending':
+                return False
+            self._state = 'running'
+            return True
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    # Cancel a job the writer has not started. Returns False if it has.
+    def cancel(self):
+        with self._lock:
+            if self._state != 'pending':
+                return False
+            self._state = 'cancelled'
+            return True
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+# Helper function to check if an error means another connection holds the lock
+def is_lock_error(error):
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def timed_out_error():
+    return WriteUnavailable('Timed out waiting for the database, try again later')
+
+class WriteQueue:
+    """Queue of write jobs served by one writer thread per process."""
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._metrics = {
+            'submitted': 0, 'committed': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0,
+            'groups': 0, 'max_group_size': 0, 'retries': 0
+        }
+
+    # Start the writer thread on first use, and again in a forked process
+    def start(self):
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='db-writer', daemon=True)
+                self._thread.start()
+
+    # Run fn(conn) on the writer thread and return its result.
+    # fn must not commit or roll back; raising rolls back its own changes only.
+    # Raises WriteUnavailable if the queue is full or the job did not commit
+    # within timeout seconds.
+    def submit(self, fn, timeout=WRITE_WAIT_TIMEOUT):
+        self.start()
+        job = WriteJob(fn, time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count('rejected')
+            raise WriteUnavailable('Too many pending writes, try again later')
+        self._count('submitted')
+
+        if not job.wait(timeout):
+            if job.cancel():
+                self._count('timed_out')
+                raise timed_out_error()
+            # The writer has started the job. Its group is not retried past
+            # the deadline, so it ends within one attempt: at most
+            # WRITE_BUSY_TIMEOUT for the lock plus running the group.
+            job.wait(None)
+
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['queued'] = self._queue.qsize() if self._queue is not None else 0
+            return metrics
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._metrics[name] += amount
+
+    def _run(self, jobs_queue):
+        conn = None
+        while True:
+            jobs = [jobs_queue.get()]
+            while len(jobs) < GROUP_COMMIT_MAX:
+                try:
+                    jobs.append(jobs_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            jobs = [job for job in jobs if job.claim()]
+            if not jobs:
+                continue
+
+            try:
+                if conn is None:
+                    conn = connect_writer(self.db_path, timeout=WRITE_BUSY_TIMEOUT)
+                    # Transactions are started explicitly by run_group
+                    conn.isolation_level = None
+                self.run_group(conn, jobs)
+            except Exception as e:
+                logger.exception('Write group failed')
+                for job in jobs:
+                    job.finish(error=e)
+                self._count('failed', len(jobs))
+                if conn is not None:
+                    conn.close()
+                    conn = None
+
+    # Run a group of jobs in one transaction, retrying it while the database
+    # is locked. Jobs past their deadline are not retried but finished with
+    # WriteUnavailable; nothing of them was committed.
+    def run_group(self, conn, jobs):
+        attempt = 0
+        while True:
+            try:
+                outcomes = self.execute_group(conn, jobs)
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                if not is_lock_error(e):
+                    raise
+                jobs = self.expire_jobs(jobs)
+                if not jobs:
+                    return
+                delay = min(WRITE_RETRY_BASE_DELAY * 2 ** attempt, WRITE_RETRY_MAX_DELAY)
+                # Sleep no longer than the first deadline of the group
+                delay = min(delay, max(0, min(job.deadline for job in jobs) - time.monotonic()))
+                self._count('retries')
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            for job, (result, error) in zip(jobs, outcomes):
+                job.finish(result, error)
+
+            with self._lock:
+                self._metrics['groups'] += 1
+                self._metrics['committed'] += sum(1 for _, error in outcomes if error is None)
+                self._metrics['failed'] += sum(1 for _, error in outcomes if error is not None)
+                self._metrics['max_group_size'] = max(self._metrics['max_group_size'], len(jobs))
+            return
+
+    # Finish the jobs past their deadline with WriteUnavailable and return the others
+    def expire_jobs(self, jobs):
+        pending = []
+        for job in jobs:
+            if job.expired():
+                job.finish(error=timed_out_error())
+                self._count('timed_out')
+            else:
+                pending.append(job)
+        return pending
+
+    # Execute every job in its own savepoint and commit the group.
+    # Returns a (result, error) pair per job.
+    def execute_group(self, conn, jobs):
+        outcomes = []
+        conn.execute('BEGIN IMMEDIATE')
+        for job in jobs:
+            conn.execute('SAVEPOINT write_job')
+            try:
+                result = job.fn(conn)
+            except Exception as e:
+                # Lock errors abort the whole group, so it can be retried
+                if is_lock_error(e):
+                    raise
+                conn.execute('ROLLBACK TO write_job')
+                conn.execute('RELEASE write_job')
+                outcomes.append((None, e))
+            else:
+                conn.execute('RELEASE write_job')
+                outcomes.append((result, None))
+        conn.commit()
+        return outcomes
+
+# Writer shared by all requests of the process
+write_queue = WriteQueue()
+
+# Build the 503 response for a write that could not be run
+def write_unavailable_response(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
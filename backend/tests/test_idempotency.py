@@ -0,0 +1,126 @@
+"""
+Tests of the Idempotency-Key handling in src/utils/idempotency.py.
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+
+import os
+import sqlite3
+import sys
+from functools import wraps
+
+import pytest
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.database_schema import init_db
+from src.utils import idempotency, rate_limit as rate_limit_module
+from src.utils.idempotency import idempotent
+from src.utils.rate_limit import MemoryBackend, rate_limit
+
+USER = {'id': 1, 'role': 'executor'}
+
+# Stand-in for token_required that passes a fixed user
+def fake_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        return f(USER, *args, **kwargs)
+    return decorated
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'test.db')
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (id, email, password, role) VALUES (1, 'e@x', '', 'executor')")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(idempotency, 'DB_PATH', db_path)
+    monkeypatch.setattr(rate_limit_module, 'rate_limit_backend', MemoryBackend())
+
+    app = Flask(__name__)
+    app.db_path = db_path
+    app.calls = 0
+
+    # Decorated like create_response
+    @app.route('/charge', methods=['POST'])
+    @fake_token_required
+    @idempotent
+    @rate_limit('charge', 1, 60, key='user')
+    def charge(current_user):
+        app.calls += 1
+        return jsonify({'charge': app.calls}), 201
+
+    return app
+
+def test_replays_completed_request(app):
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'k1'}
+
+    first = client.post('/charge', json={}, headers=headers)
+    retry = client.post('/charge', json={}, headers=headers)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == {'charge': 1}
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert app.calls == 1
+
+def test_rate_limited_request_is_not_replayed(app, monkeypatch):
+    client = app.test_client()
+
+    # Use up the single token without a key
+    assert client.post('/charge', json={}).status_code == 201
+
+    limited = client.post('/charge', json={}, headers={'Idempotency-Key': 'k2'})
+    assert limited.status_code == 429
+
+    # Once the limiter allows requests again, the retry runs instead of replaying the 429
+    monkeypatch.setattr(rate_limit_module, 'rate_limit_backend', MemoryBackend())
+    retry = client.post('/charge', json={}, headers={'Idempotency-Key': 'k2'})
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert app.calls == 2
+
+def test_key_reused_for_different_request(app):
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'k3'}
+
+    assert client.post('/charge', json={'amount': 1}, headers=headers).status_code == 201
+    assert client.post('/charge', json={'amount': 2}, headers=headers).status_code == 422
+
+def test_abandoned_request_is_not_run_again(app, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_TIMEOUT', 0.2)
+
+    # A key left in progress an hour ago, e.g. by a process that died
+    conn = sqlite3.connect(app.db_path)
+    conn.execute('''
+        INSERT INTO idempotency_keys (user_id, key, request_hash, created_at, expires_at)
+        VALUES (1, 'k4', ?, datetime('now', '-1 hour'), datetime('now', '+1 hour'))
+    ''', (idempotency.hashlib.sha256(b'POST\n/charge\n{}').hexdigest(),))
+    conn.commit()
+    conn.close()
+
+    retry = app.test_client().post('/charge', data='{}', content_type='application/json', headers={'Idempotency-Key': 'k4'})
+    assert retry.status_code == 409
+    assert app.calls == 0
+
+def test_response_is_returned_when_it_can_not_be_stored(app, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_TIMEOUT', 0.2)
+
+    def locked(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    client = app.test_client()
+    headers = {'Idempotency-Key': 'k5'}
+
+    with monkeypatch.context() as m:
+        m.setattr(idempotency, 'store_response', locked)
+        first = client.post('/charge', json={}, headers=headers)
+    assert first.status_code == 201
+
+    # The charge went through, so a retry must not run it again
+    assert client.post('/charge', json={}, headers=headers).status_code == 409
+    assert app.calls == 1